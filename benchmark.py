@@ -0,0 +1,264 @@
+import os, sys, io, json, argparse, platform
+import random as r
+import multiprocessing as mp
+
+from contextlib import redirect_stdout
+from datetime import datetime
+from glob import glob
+from time import perf_counter
+
+from state import State, HARD_QUOTIENTS
+from hill_climb import hill_climbing_random_restart, hill_climbing_first_X, hill_climbing
+from mcts import run_mcts
+import mcts
+
+try:
+    import resource
+except ImportError:
+    resource = None # no peak memory on platforms without getrusage
+
+BENCHMARK_VERSION = 2
+ALGORITHMS = {
+    'hc': hill_climbing_random_restart,
+    'hc_first': hill_climbing_first_X,
+    'hc_classic': hill_climbing,
+    'mcts': run_mcts,
+}
+SEED = 42
+N_TRIALS = 3
+N_REPEATS = 3 # runs of each trial, the fastest one is kept -> the noise of the machine is not measured
+TOLERANCE = 0.10 # relative change of a metric that is reported as a regression
+MIN_TIME = 0.3 # seconds, the times below it are mostly noise -> not compared (see compare_results)
+
+
+def track_first_feasible() -> dict:
+    '''
+        Records the first time (perf_counter) a state of the search has no hard constraint violations, in found['time']
+        State.commit is wrapped in this process -> every move the search keeps (push_move + commit, apply_move) is checked
+        The states of the MCTS rollouts are only simulations, not states of the search -> mcts.rollout is wrapped to skip them
+    '''
+    found = {'time': None}
+    rollouts = [0] # rollouts running
+
+    commit = State.commit
+    def tracked_commit(self):
+        commit(self)
+        if found['time'] is None and not rollouts[0] and not any(self.fitness[constraint] for constraint in HARD_QUOTIENTS):
+            found['time'] = perf_counter()
+
+    rollout = mcts.rollout
+    def tracked_rollout(state):
+        rollouts[0] += 1
+        try:
+            return rollout(state)
+        finally:
+            rollouts[0] -= 1
+
+    State.commit = tracked_commit
+    mcts.rollout = tracked_rollout
+    return found
+
+
+def run_benchmark_trial(args: tuple) -> dict:
+    '''
+        Runs one trial of an algorithm on an input file and measures it
+        Runs in a fresh process (see run_benchmark) -> the peak memory is the one of this trial only
+        The environment is loaded (and the initial state built) before the clock starts
+        The time to feasible is measured from the start to the first state without hard constraint violations (see track_first_feasible)
+    '''
+    algorithm_name, input_file, seed, compact, kwargs = args
+
+    State.INPUT_FILE = input_file
+    State.COMPACT = compact
+    State.export_env() # loads the environment without printing it
+
+    r.seed(seed)
+    initial = State()
+    first_feasible = track_first_feasible()
+
+    # the algorithms print their progress -> only the measurements are kept
+    with redirect_stdout(io.StringIO()):
+        time_start = perf_counter()
+        is_final, iters, num_states, final_state = ALGORITHMS[algorithm_name](initial, **kwargs)
+        elapsed = perf_counter() - time_start
+
+    hard = sum(final_state.fitness[constraint] for constraint in HARD_QUOTIENTS)
+    return {
+        'seed': seed,
+        'is_final': is_final,
+        'feasible': hard == 0,
+        'iters': iters,
+        'num_states': num_states,
+        'time': elapsed,
+        'states_per_sec': num_states / elapsed if elapsed > 0 else None,
+        'time_to_feasible': first_feasible['time'] - time_start if first_feasible['time'] is not None else None,
+        'final_fitness': final_state.total_fitness(),
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None,
+    }
+
+
+def fastest_run(runs: list) -> dict:
+    '''
+        Merges the runs of the same trial (same seed -> same search) into one trial
+        The times are the minimums over the runs, the peak memory too (the noise only adds to them)
+    '''
+    trial = dict(min(runs, key=lambda run: run['time']))
+    times_to_feasible = [run['time_to_feasible'] for run in runs if run['time_to_feasible'] is not None]
+    trial['time_to_feasible'] = min(times_to_feasible, default=None)
+    peak_memories = [run['peak_memory_kb'] for run in runs if run['peak_memory_kb'] is not None]
+    trial['peak_memory_kb'] = min(peak_memories, default=None)
+    trial['runs'] = len(runs)
+    return trial
+
+
+def summarize(trials: list) -> dict:
+    '''
+        Aggregates the trials of one (algorithm, input file) pair
+    '''
+    def mean(values):
+        values = [value for value in values if value is not None]
+        return sum(values) / len(values) if values else None
+
+    return {
+        'feasible': sum(trial['feasible'] for trial in trials),
+        'wins': sum(trial['is_final'] for trial in trials),
+        'trials': len(trials),
+        'time': mean(trial['time'] for trial in trials),
+        'states_per_sec': mean(trial['states_per_sec'] for trial in trials),
+        'time_to_feasible': mean(trial['time_to_feasible'] for trial in trials),
+        'final_fitness': mean(trial['final_fitness'] for trial in trials),
+        'peak_memory_kb': max((trial['peak_memory_kb'] for trial in trials if trial['peak_memory_kb'] is not None), default=None),
+    }
+
+
+def run_benchmark(algorithms: list, input_files: list, n_trials: int = N_TRIALS, seed: int = SEED, compact: bool = False,
+                  budget: int = None, n_repeats: int = N_REPEATS, print_flag: bool = True) -> dict:
+    '''
+        Runs n_trials trials of every algorithm on every input file, trial i with the seed seed + i
+        Each trial is run n_repeats times and its fastest run is kept (see fastest_run)
+        Each run is in a new (spawned) process, one at a time -> the runs don t share memory or CPU
+        Returns the results as a JSON serializable dict
+    '''
+    results = []
+    context = mp.get_context('spawn')
+
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for input_file in input_files:
+            for algorithm_name in algorithms:
+                kwargs = {'budget': budget} if algorithm_name == 'mcts' and budget is not None else {}
+                if algorithm_name == 'hc':
+                    kwargs['print_flag'] = False
+
+                tasks = [(algorithm_name, input_file, seed + trial, compact, kwargs) for trial in range(n_trials) for _ in range(n_repeats)]
+                runs = pool.map(run_benchmark_trial, tasks, chunksize=1)
+                trials = [fastest_run(runs[i:i + n_repeats]) for i in range(0, len(runs), n_repeats)]
+                summary = summarize(trials)
+                results.append({'algorithm': algorithm_name, 'input': input_file, 'summary': summary, 'trials': trials})
+
+                if print_flag:
+                    print(f"{algorithm_name:>10} | {os.path.basename(input_file):<28} | {format_summary(summary)}")
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {'seed': seed, 'n_trials': n_trials, 'n_repeats': n_repeats, 'compact': compact, 'budget': budget, 'hard_quotients': HARD_QUOTIENTS},
+        'results': results,
+    }
+
+
+def format_summary(summary: dict) -> str:
+    '''
+        Returns the summary of an (algorithm, input file) pair on one line
+    '''
+    def fmt(value, spec, unit=''):
+        return 'n/a' if value is None else format(value, spec) + unit
+
+    return (f"feasible {summary['feasible']}/{summary['trials']} | states/s {fmt(summary['states_per_sec'], '.0f')} | "
+            f"time to feasible {fmt(summary['time_to_feasible'], '.3f', 's')} | fitness {fmt(summary['final_fitness'], '.2f')} | "
+            f"peak mem {fmt(summary['peak_memory_kb'], 'd', ' KB')}")
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = TOLERANCE, min_time: float = MIN_TIME) -> list:
+    '''
+        Compares two benchmark results (see run_benchmark) pair by pair and returns the regressions of current:
+            - fewer feasible trials, or a higher final fitness
+            - states/sec lower by more than tolerance (relative)
+            - time to feasible or peak memory higher by more than tolerance (relative)
+        The times are only compared when the baseline took at least min_time seconds -> the runs of a few ms are noise
+        The pairs that are only in one of the results are skipped
+    '''
+    baseline_pairs = {(result['algorithm'], result['input']): result['summary'] for result in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        key = (result['algorithm'], result['input'])
+        if key not in baseline_pairs:
+            continue
+        old, new = baseline_pairs[key], result['summary']
+
+        def flag(metric, message):
+            regressions.append({'algorithm': key[0], 'input': key[1], 'metric': metric,
+                                'baseline': old[metric], 'current': new[metric], 'message': message})
+
+        if new['feasible'] / new['trials'] < old['feasible'] / old['trials']:
+            flag('feasible', "fewer feasible trials")
+        if old['final_fitness'] is not None and new['final_fitness'] is not None and new['final_fitness'] > old['final_fitness']:
+            flag('final_fitness', "higher final fitness")
+        timed = old.get('time') is not None and old['time'] >= min_time
+        if timed and old['states_per_sec'] and new['states_per_sec'] is not None and new['states_per_sec'] < old['states_per_sec'] * (1 - tolerance):
+            flag('states_per_sec', f"states/sec down {1 - new['states_per_sec'] / old['states_per_sec']:.1%}")
+        if old['time_to_feasible'] is not None and old['time_to_feasible'] >= min_time and new['time_to_feasible'] is not None \
+                and new['time_to_feasible'] > old['time_to_feasible'] * (1 + tolerance):
+            flag('time_to_feasible', f"time_to_feasible up {new['time_to_feasible'] / old['time_to_feasible'] - 1:.1%}")
+        if old['peak_memory_kb'] and new['peak_memory_kb'] is not None and new['peak_memory_kb'] > old['peak_memory_kb'] * (1 + tolerance):
+            flag('peak_memory_kb', f"peak_memory_kb up {new['peak_memory_kb'] / old['peak_memory_kb'] - 1:.1%}")
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(usage="python3 benchmark.py run [-o FILE] [--algorithms ...] [--inputs ...] [--trials N] [--repeat R] [--seed S] [--budget N] [--compact]\n"
+                                           "       python3 benchmark.py compare BASELINE CURRENT [--tolerance T] [--min-time S]")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the benchmark and write the results as JSON")
+    run_parser.add_argument('-o', '--output', default='benchmark.json', help="file of the results (default benchmark.json)")
+    run_parser.add_argument('--algorithms', nargs='+', choices=list(ALGORITHMS), default=list(ALGORITHMS))
+    run_parser.add_argument('--inputs', nargs='+', default=None, help="input files (default: every file in inputs/)")
+    run_parser.add_argument('--trials', type=int, default=N_TRIALS, help=f"trials of each algorithm on each input file (default {N_TRIALS})")
+    run_parser.add_argument('--repeat', type=int, default=N_REPEATS, help=f"runs of each trial, the fastest one is kept (default {N_REPEATS})")
+    run_parser.add_argument('--seed', type=int, default=SEED, help=f"seed of the first trial, trial i uses seed + i (default {SEED})")
+    run_parser.add_argument('--budget', type=int, default=None, help="mcts: number of iterations per decision (default 50)")
+    run_parser.add_argument('--compact', action='store_true', help="hold the timetables in flat arrays (see orar.py --compact)")
+
+    compare_parser = commands.add_parser('compare', help="flag the regressions of a result against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=TOLERANCE, help=f"relative change reported as a regression (default {TOLERANCE})")
+    compare_parser.add_argument('--min-time', type=float, default=MIN_TIME, help=f"times of the baseline below it (seconds) are not compared (default {MIN_TIME})")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        input_files = args.inputs if args.inputs is not None else sorted(glob('inputs/*.yaml'))
+        results = run_benchmark(args.algorithms, input_files, n_trials=args.trials, seed=args.seed, compact=args.compact, budget=args.budget,
+                                n_repeats=args.repeat)
+
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+
+        regressions = compare_results(baseline, current, args.tolerance, args.min_time)
+        for regression in regressions:
+            print(f"REGRESSION {regression['algorithm']:>10} | {os.path.basename(regression['input']):<28} | {regression['message']} "
+                  f"({regression['baseline']} -> {regression['current']})")
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -1,5 +1,7 @@
 import yaml
 import argparse
+import json
+import os
 import sys
 from utils import read_yaml_file, get_profs_initials, pretty_print_timetable
 
@@ -197,6 +199,203 @@ def check_optional_constraints(timetable : {str : {(int, int) : {str : (str, str
 
     return constrangeri_incalcate
 
+#################### VALIDARE IN LOT ####################
+def index_specs(timetable_specs : dict) -> dict:
+    '''
+    Precalculează, o singură dată pentru o instanță, datele de care au nevoie verificările (vezi validate_assignments):
+    - inițialele profesorilor, capacitatea și materiile fiecărei săli, materiile fiecărui profesor
+    - pentru fiecare profesor, de câte ori interzice fiecare zi și fiecare interval de 2 ore (o constrângere repetată se numără de 2 ori, ca în check_optional_constraints)
+    '''
+    _, initials_to_prof = get_profs_initials(timetable_specs[PROFESORI])
+
+    forbidden_days = {}
+    forbidden_intervals = {}
+    for prof in timetable_specs[PROFESORI]:
+        forbidden_days[prof] = {}
+        forbidden_intervals[prof] = {}
+        for const in timetable_specs[PROFESORI][prof][CONSTRANGERI]:
+            if const[0] != '!':
+                continue
+            const = const[1:]
+
+            if const in timetable_specs[ZILE]:
+                forbidden_days[prof][const] = forbidden_days[prof].get(const, 0) + 1
+            elif '-' in const:
+                start, end = parse_interval(const)
+                intervals = [(i, i + 2) for i in range(start, end, 2)] if start != end - 2 else [(start, end)]
+                for interval in intervals:
+                    forbidden_intervals[prof][interval] = forbidden_intervals[prof].get(interval, 0) + 1
+
+    return {
+        'days' : timetable_specs[ZILE],
+        'intervals' : [eval(interval) for interval in timetable_specs[INTERVALE]],
+        'coverage' : timetable_specs[MATERII],
+        'initials_to_prof' : initials_to_prof,
+        'capacity' : {room : timetable_specs[SALI][room][CAPACITATE] for room in timetable_specs[SALI]},
+        'room_subjects' : {room : set(timetable_specs[SALI][room][MATERII]) for room in timetable_specs[SALI]},
+        'prof_subjects' : {prof : set(timetable_specs[PROFESORI][prof][MATERII]) for prof in timetable_specs[PROFESORI]},
+        'forbidden_days' : forbidden_days,
+        'forbidden_intervals' : forbidden_intervals,
+    }
+
+
+def parse_output_file(output_name : str, specs_index : dict) -> tuple:
+    '''
+    Citește un fișier de ieșire într-o singură trecere: fiecare linie este împărțită o singură dată, iar textul fiecărei celule
+    este parsat o singură dată per fișier
+
+    Returnează lista alocărilor (zi, interval, sală, profesor, materie) și lista sălilor ocupate de 2 materii în același interval
+    '''
+    days = specs_index['days']
+    initials_to_prof = specs_index['initials_to_prof']
+    cells = {} # textul celulei -> (materie, sală, profesor)
+
+    assignments = []
+    double_rooms = []
+    occupied = set()
+    interval = None
+
+    with open(output_name, 'r') as file:
+        for line in file:
+            if line[0] != '|':
+                continue
+
+            crt_parsing = line.split('|')
+            crt_interval = crt_parsing[1].strip()
+            if crt_interval == 'Interval':
+                continue
+            if crt_interval != '':
+                interval = parse_interval(crt_interval)
+
+            for day, cell in zip(days, crt_parsing[2:]):
+                parsed = cells.get(cell)
+                if parsed is None:
+                    parsed = cells[cell] = parse_subject_room_prof(cell.strip(), initials_to_prof)
+                subject, room, prof = parsed
+                if not subject:
+                    continue
+
+                # ACEEASI SALA ESTE OCUPATA DE 2 MATERII IN ACELASI INTERVAL
+                if (day, interval, room) in occupied:
+                    double_rooms.append((day, interval, room))
+                    continue
+                occupied.add((day, interval, room))
+                assignments.append((day, interval, room, prof, subject))
+
+    return assignments, double_rooms
+
+
+def timetable_assignments(timetable : {str : {(int, int) : {str : (str, str)}}}) -> list:
+    '''
+    Returnează lista alocărilor (zi, interval, sală, profesor, materie) ale unui orar din memorie
+    '''
+    return [(day, interval, room, *timetable[day][interval][room])
+            for day in timetable for interval in timetable[day] for room in timetable[day][interval] if timetable[day][interval][room]]
+
+
+def validate_assignments(assignments : list, specs_index : dict, double_rooms : list = ()) -> dict:
+    '''
+    Verifică toate constrângerile (obligatorii și opționale) ale unui orar dat ca listă de alocări, în timp O(alocări):
+    alocările sunt indexate după profesor, iar constrângerile profesorilor sunt căutate în tabelele din index_specs
+
+    Numără aceleași încălcări ca check_mandatory_constraints și check_optional_constraints (o sală ocupată de 2 materii
+    este numărată drept încălcare obligatorie) și returnează un raport serializabil JSON
+    '''
+    violations = [{'tip' : 'sala_ocupata_de_2_ori', 'zi' : day, 'interval' : list(interval), 'sala' : room} for day, interval, room in double_rooms]
+    mandatory = len(violations)
+    optional = 0
+
+    by_prof = {}
+    coverage = {subject : 0 for subject in specs_index['coverage']}
+    for day, interval, room, prof, subject in assignments:
+        by_prof.setdefault(prof, []).append((day, interval, room, subject))
+        coverage[subject] = coverage.get(subject, 0) + specs_index['capacity'][room]
+
+    for prof, classes in by_prof.items():
+        busy = set()
+        forbidden_days = specs_index['forbidden_days'][prof]
+        forbidden_intervals = specs_index['forbidden_intervals'][prof]
+
+        for day, interval, room, subject in classes:
+            # PROFESORUL PREDĂ 2 MATERII ÎN ACELAȘI INTERVAL
+            if (day, interval) in busy:
+                violations.append({'tip' : 'profesor_ocupat_de_2_ori', 'profesor' : prof, 'zi' : day, 'interval' : list(interval)})
+                mandatory += 1
+            else:
+                busy.add((day, interval))
+
+            # MATERIA NU SE PREDA IN SALA
+            if subject not in specs_index['room_subjects'][room]:
+                violations.append({'tip' : 'materie_in_sala_gresita', 'materie' : subject, 'sala' : room})
+                mandatory += 1
+
+            # PROFESORUL NU PREDA MATERIA
+            if subject not in specs_index['prof_subjects'][prof]:
+                violations.append({'tip' : 'profesor_nu_preda_materia', 'profesor' : prof, 'materie' : subject})
+                mandatory += 1
+
+            # ZILE SI INTERVALE NEDORITE
+            for _ in range(forbidden_days.get(day, 0)):
+                violations.append({'tip' : 'zi_nedorita', 'profesor' : prof, 'zi' : day})
+                optional += 1
+            for _ in range(forbidden_intervals.get(interval, 0)):
+                violations.append({'tip' : 'interval_nedorit', 'profesor' : prof, 'zi' : day, 'interval' : list(interval)})
+                optional += 1
+
+        # CONDITIA DE MAXIM 7 ORE PE SĂPTĂMÂNĂ
+        if len(classes) > 7:
+            violations.append({'tip' : 'peste_7_sloturi', 'profesor' : prof, 'sloturi' : len(classes)})
+            mandatory += 1
+
+    # CONDITIA DE ACOPERIRE
+    for subject, target in specs_index['coverage'].items():
+        if coverage[subject] < target:
+            violations.append({'tip' : 'acoperire_insuficienta', 'materie' : subject, 'acoperire' : coverage[subject], 'necesar' : target})
+            mandatory += 1
+
+    return {
+        'valid' : mandatory == 0,
+        'obligatorii' : mandatory,
+        'optionale' : optional,
+        'incalcari' : violations,
+    }
+
+
+def validate_timetables(timetables : list, timetable_specs : dict) -> list:
+    '''
+    Validează o listă de orare din memorie ({zi : {interval : {sală : (profesor, materie)}}}) ale aceleiași instanțe
+    Returnează câte un raport (vezi validate_assignments) pentru fiecare orar
+    '''
+    specs_index = index_specs(timetable_specs)
+    return [validate_assignments(timetable_assignments(timetable), specs_index) for timetable in timetables]
+
+
+def validate_directory(outputs_dir : str = 'outputs', inputs_dir : str = 'inputs') -> dict:
+    '''
+    Validează toate fișierele de ieșire (.txt) din outputs_dir; fișierul de intrare al lui <nume>.txt este inputs_dir/<nume>.yaml
+    Specificațiile fiecărei instanțe sunt citite și indexate o singură dată
+
+    Returnează {nume : raport}; un fișier care nu poate fi citit are în raport cheia 'eroare'
+    '''
+    indexes = {}
+    reports = {}
+
+    for output_file in sorted(os.listdir(outputs_dir)):
+        name, ext = os.path.splitext(output_file)
+        if ext != '.txt':
+            continue
+
+        try:
+            if name not in indexes:
+                indexes[name] = index_specs(read_yaml_file(os.path.join(inputs_dir, f'{name}.yaml')))
+            assignments, double_rooms = parse_output_file(os.path.join(outputs_dir, output_file), indexes[name])
+            reports[name] = validate_assignments(assignments, indexes[name], double_rooms)
+        except (OSError, KeyError, ValueError, IndexError, yaml.YAMLError) as error:
+            reports[name] = {'valid' : False, 'eroare' : f'{type(error).__name__}: {error}'}
+
+    return reports
+
+
 if __name__ == '__main__':
 
     
@@ -206,6 +405,16 @@ if __name__ == '__main__':
 
     if sys.argv[1] == '-h':
         print('\nSe rulează de exemplu:\n\npython3 check_constraints.py orar_mic_exact\n')
+        print('Sau, pentru toate fișierele de ieșire dintr-un director (raport JSON):\n\npython3 check_constraints.py --batch [director_iesiri] [director_intrari]\n')
+
+    if sys.argv[1] == '--batch':
+        outputs_dir = sys.argv[2] if len(sys.argv) > 2 else 'outputs'
+        inputs_dir = sys.argv[3] if len(sys.argv) > 3 else 'inputs'
+
+        reports = validate_directory(outputs_dir, inputs_dir)
+        json.dump(reports, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        sys.exit(0 if all(report['valid'] for report in reports.values()) else 1)
 
     name = sys.argv[1]
 
@@ -0,0 +1,189 @@
+from array import array
+
+
+class CompactLayout:
+    '''
+        Integer indexing of the days, intervals, classrooms, professors and subjects of an instance
+    '''
+    def __init__(self, days: list, intervals: list, rooms: list, profs: list, subjects: list) -> None:
+        self.days = list(days)
+        self.intervals = list(intervals)
+        self.rooms = list(rooms)
+        self.profs = list(profs)
+        self.subjects = list(subjects)
+
+        self.day_idx = {day: i for i, day in enumerate(self.days)}
+        self.interval_idx = {interval: i for i, interval in enumerate(self.intervals)}
+        self.room_idx = {room: i for i, room in enumerate(self.rooms)}
+        self.prof_idx = {prof: i for i, prof in enumerate(self.profs)}
+        self.subject_idx = {subject: i for i, subject in enumerate(self.subjects)}
+
+        # strides of the flat grid: cell = (day * num_intervals + interval) * num_rooms + room
+        self.num_rooms = len(self.rooms)
+        self.day_stride = len(self.intervals) * self.num_rooms
+        self.size = len(self.days) * self.day_stride
+
+        # time slots of the week: slot = day * num_intervals + interval
+        self.num_intervals = len(self.intervals)
+        self.num_slots = len(self.days) * self.num_intervals
+        self.day_mask = (1 << self.num_intervals) - 1
+        self.slot_idx = {(day, interval): d * self.num_intervals + i for d, day in enumerate(self.days) for i, interval in enumerate(self.intervals)}
+
+        # a cell holds 0 if the classroom is empty, otherwise 1 + prof * num_subjects + subject
+        self.num_subjects = len(self.subjects)
+        max_code = len(self.profs) * self.num_subjects
+        self.typecode = 'H' if max_code < 2 ** 16 else 'L'
+
+
+    def encode(self, value: tuple) -> int:
+        '''
+            Encodes a (professor, subject) pair (or None) into a cell code
+        '''
+        if value is None:
+            return 0
+        prof, subject = value
+        return 1 + self.prof_idx[prof] * self.num_subjects + self.subject_idx[subject]
+
+
+    def decode(self, code: int) -> tuple:
+        '''
+            Decodes a cell code into a (professor, subject) pair (or None)
+        '''
+        if code == 0:
+            return None
+        prof, subject = divmod(code - 1, self.num_subjects)
+        return self.profs[prof], self.subjects[subject]
+
+
+    def cell(self, day: str, interval: tuple, classroom: str) -> int:
+        '''
+            Returns the index in the flat grid of a (day, interval, classroom) cell
+        '''
+        return self.day_idx[day] * self.day_stride + self.interval_idx[interval] * self.num_rooms + self.room_idx[classroom]
+
+
+class CompactTimetable:
+    '''
+        Timetable held in a flat array of cell codes
+
+        Behaves like the nested dict {day: {interval: {classroom: (professor, subject)}}}, so the State code
+        can read and write it unchanged, but copying it is a single buffer copy
+    '''
+    __slots__ = ('layout', 'grid')
+
+    def __init__(self, layout: CompactLayout, grid: array = None) -> None:
+        self.layout = layout
+        self.grid = grid if grid is not None else array(layout.typecode, [0]) * layout.size
+
+
+    def __getitem__(self, day: str):
+        return _DayView(self, self.layout.day_idx[day] * self.layout.day_stride)
+
+    def __contains__(self, day: str) -> bool:
+        return day in self.layout.day_idx
+
+    def __iter__(self):
+        return iter(self.layout.days)
+
+    def __len__(self) -> int:
+        return len(self.layout.days)
+
+    def keys(self):
+        return self.layout.days
+
+    def items(self):
+        return [(day, self[day]) for day in self.layout.days]
+
+
+    def __copy__(self):
+        return CompactTimetable(self.layout, array(self.layout.typecode, self.grid))
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+
+    def to_dict(self) -> dict:
+        '''
+            Returns the nested dict view of the timetable
+        '''
+        layout = self.layout
+        timetable = {}
+        for d, day in enumerate(layout.days):
+            timetable[day] = {}
+            for i, interval in enumerate(layout.intervals):
+                base = d * layout.day_stride + i * layout.num_rooms
+                timetable[day][interval] = {room: layout.decode(self.grid[base + r]) for r, room in enumerate(layout.rooms)}
+        return timetable
+
+
+class _DayView:
+    '''
+        View over the intervals of one day of a CompactTimetable
+    '''
+    __slots__ = ('timetable', 'base')
+
+    def __init__(self, timetable: CompactTimetable, base: int) -> None:
+        self.timetable = timetable
+        self.base = base
+
+    def __getitem__(self, interval: tuple):
+        layout = self.timetable.layout
+        return _IntervalView(self.timetable, self.base + layout.interval_idx[interval] * layout.num_rooms)
+
+    def __contains__(self, interval: tuple) -> bool:
+        return interval in self.timetable.layout.interval_idx
+
+    def __iter__(self):
+        return iter(self.timetable.layout.intervals)
+
+    def __len__(self) -> int:
+        return len(self.timetable.layout.intervals)
+
+    def keys(self):
+        return self.timetable.layout.intervals
+
+    def items(self):
+        return [(interval, self[interval]) for interval in self.timetable.layout.intervals]
+
+
+class _IntervalView:
+    '''
+        View over the classrooms of one (day, interval) of a CompactTimetable
+    '''
+    __slots__ = ('timetable', 'base')
+
+    def __init__(self, timetable: CompactTimetable, base: int) -> None:
+        self.timetable = timetable
+        self.base = base
+
+    def __getitem__(self, classroom: str) -> tuple:
+        layout = self.timetable.layout
+        return layout.decode(self.timetable.grid[self.base + layout.room_idx[classroom]])
+
+    def __setitem__(self, classroom: str, value: tuple) -> None:
+        layout = self.timetable.layout
+        self.timetable.grid[self.base + layout.room_idx[classroom]] = layout.encode(value)
+
+    def __contains__(self, classroom: str) -> bool:
+        return classroom in self.timetable.layout.room_idx
+
+    def __iter__(self):
+        return iter(self.timetable.layout.rooms)
+
+    def __len__(self) -> int:
+        return self.timetable.layout.num_rooms
+
+    def keys(self):
+        return self.timetable.layout.rooms
+
+    def items(self):
+        return [(classroom, self[classroom]) for classroom in self.timetable.layout.rooms]
+
+
+def timetable_to_dict(timetable) -> dict:
+    '''
+        Returns the nested dict view of a timetable (dict or CompactTimetable)
+    '''
+    if isinstance(timetable, CompactTimetable):
+        return timetable.to_dict()
+    return timetable
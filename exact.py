@@ -0,0 +1,434 @@
+import math as m
+
+from my_utils import *
+from state import State, HARD_QUOTIENTS, SOFT_QUOTIENT
+from hill_climb import hill_climbing
+
+HEURISTIC_RESTARTS = 5 # greedy constructions tried for the first upper bound of the search
+
+
+def build_domains():
+    '''
+        Builds the static data of the search:
+            cells: list of every (day, interval, classroom) -> a class is identified by the index of its cell
+            domains: {subject: list(cell index, capacity, professors)} -> the cells where the subject can be taught
+            penalty: {(professor, day, interval): soft penalty of the professor teaching then}
+    '''
+    layout = State.LAYOUT
+    cells = [(day, interval, classroom) for day in layout.days for interval in layout.intervals for classroom in layout.rooms]
+
+    domains = {
+        subject: [(idx, State.CLASSROOMS[classroom][CAPACITATE], State.SUBJECTS[subject][PROF_FOR_SUBJECT])
+                  for idx, (_, _, classroom) in enumerate(cells) if classroom in State.SUBJECTS[subject][CLASS_FOR_SUBJECT]]
+        for subject in State.SUBJECTS
+    }
+
+    penalty = {}
+    for prof in State.CONSTRAINTS:
+        for day in layout.days:
+            for interval in layout.intervals:
+                penalty[(prof, day, interval)] = (
+                    (day in State.CONSTRAINTS[prof][DAY_CONSTRAINTS]) + (interval in State.CONSTRAINTS[prof][INT_CONSTRAINTS])
+                ) * SOFT_QUOTIENT
+
+    return cells, domains, penalty
+
+
+def cover_bound(subject_options: list, left: int) -> int:
+    '''
+        Lower bound of the soft penalty of the classes still needed by a subject: the classes are taken cheapest
+        (penalty per student) first and the last one only partly (the fractional relaxation of the covering problem)
+    '''
+    # the cheapest professor of every cell
+    cheapest = {}
+    for idx, cap, _, pen in subject_options:
+        if idx not in cheapest or pen < cheapest[idx][1]:
+            cheapest[idx] = (cap, pen)
+
+    bound = 0
+    for cap, pen in sorted(cheapest.values(), key=lambda option: option[1] / option[0]):
+        if left <= 0:
+            break
+        bound += pen * min(1, left / cap)
+        left -= cap
+    return m.ceil(bound - 1e-9)
+
+
+def min_classes(capacities: list, left: int) -> int:
+    '''
+        Fewest classes that can hold the students left, the biggest classrooms first
+    '''
+    count = 0
+    for cap in sorted(capacities, reverse=True):
+        if left <= 0:
+            break
+        left -= cap
+        count += 1
+    return count
+
+
+def components(linked: dict) -> list:
+    '''
+        Returns the connected components of the subjects (each in the order of State.SUBJECTS), linked: {subject: set of the subjects linked to it}
+    '''
+    groups, seen = [], set()
+    for subject in State.SUBJECTS:
+        if subject in seen:
+            continue
+        group, stack = set(), [subject]
+        while stack:
+            current = stack.pop()
+            if current not in group:
+                group.add(current)
+                stack.extend(linked[current] - group)
+        seen |= group
+        groups.append([other for other in State.SUBJECTS if other in group])
+    return groups
+
+
+def heuristic_timetable(initial: State):
+    '''
+        Returns the best timetable without hard constraint violations of a few greedy constructions, each followed by a short
+        hill climbing (see State.greedy_initial_state) -> the first upper bound of the search
+        None if none is found, or if the initial state has classes (the greedy construction starts from the empty timetable)
+    '''
+    if any(initial.prof_load.values()):
+        return None
+
+    best = None
+    for _ in range(HEURISTIC_RESTARTS):
+        _, _, _, state = hill_climbing(State.greedy_initial_state())
+        if any(state.fitness[constraint] for constraint in HARD_QUOTIENTS):
+            continue
+
+        soft = state.fitness['c_soft'] + state.fitness['c_pause']
+        if best is None or soft < best.fitness['c_soft'] + best.fitness['c_pause']:
+            best = state
+        if soft == 0:
+            break
+    return best
+
+
+def solve_exact(initial: State, max_nodes: int = None, print_flag: bool = True):
+    '''
+        Complete backtracking search: finds the timetable without hard constraint violations with the lowest soft penalty
+        (c_soft + c_pause), or proves that there is none
+
+        - the subjects get one class at a time: the best cell of the subject (cheapest, then biggest) either gets the
+          class (one branch per professor) or is excluded for the subject -> every set of classes is generated once
+        - the next subject is the one with the fewest cells left (MRV), ties broken by the number of uncovered subjects
+          sharing its classrooms or professors (degree)
+        - a class never breaks a hard constraint (free classroom, free professor, at most 7 classes per professor)
+        - the groups of subjects that share no classroom and no professor are searched one after the other (see components), each
+          from the best timetable of the previous ones -> the independent subjects don t multiply the tree
+        - forward checking: a branch is cut as soon as the cells left for an uncovered subject can t hold its students, or the free
+          cells of a group of subjects with the same classrooms can t hold the classes they still need together (Hall s condition)
+        - branch and bound, from the timetable of a heuristic (see heuristic_timetable): the classes still needed by each subject cost
+          at least their fractional covering bound (see cover_bound) and a pause only gets shorter when the free slots inside its
+          day get classes (see pause_bound)
+        - once every subject is covered, extra classes that fill the pauses of the professors are tried (see extras) -> an extra
+          class can lower c_pause, so the best timetable is not always a minimal covering
+
+        The classes of the initial state are kept (the search only adds classes)
+        If max_nodes is given, the search stops after max_nodes nodes and returns the best timetable found (not proven optimal)
+        Returns the same as the other algorithms: (is_final, number of nodes, number of nodes, best state)
+    '''
+    cells, domains, penalty = build_domains()
+    slot_bits = [1 << State.LAYOUT.slot_idx[(day, interval)] for day, interval, _ in cells]
+
+    # subjects that share a classroom, subjects that share a classroom or a professor with each subject -> degree heuristic
+    classrooms = {subject: set(State.SUBJECTS[subject][CLASS_FOR_SUBJECT]) for subject in State.SUBJECTS}
+    rivals = {subject: {other for other in State.SUBJECTS if other != subject and classrooms[subject] & classrooms[other]} for subject in State.SUBJECTS}
+    neighbours = {
+        subject: rivals[subject] | {other for other in State.SUBJECTS if other != subject and
+                                    set(State.SUBJECTS[subject][PROF_FOR_SUBJECT]) & set(State.SUBJECTS[other][PROF_FOR_SUBJECT])}
+        for subject in State.SUBJECTS
+    }
+
+    # the groups of subjects that share no classroom and no professor are independent: the classes of a group never constrain
+    # the classes of another one and their soft penalties add up (c_soft and c_pause are per professor)
+    groups = components(neighbours)
+
+    # the groups of the joint capacity check: the subjects sharing classrooms, the subjects whose classrooms are all classrooms of a subject
+    joint = {frozenset(subjects) for subjects in components(rivals)}
+    joint |= {frozenset(other for other in State.SUBJECTS if classrooms[other] <= classrooms[subject]) for subject in State.SUBJECTS}
+    joint = [subjects for subjects in joint if len(subjects) > 1]
+
+    state = initial.clone()
+    occupied = [state.timetable[day][interval][classroom] is not None for day, interval, classroom in cells]
+    excluded = {subject: set() for subject in State.SUBJECTS} # cells excluded for each subject by the search
+    excluded_gaps = set() # (professor, day, interval) excluded for the extra classes by the search
+
+    # c_pause penalty of a professor for the intervals (bitmask) taught in a day
+    layout = State.LAYOUT
+    max_pause = [max((b - a for a, b in zip(starts, starts[1:])), default=None)
+                 for starts in ([interval[0] for j, interval in enumerate(layout.intervals) if mask & (1 << j)] for mask in range(1 << layout.num_intervals))]
+
+    def pause_penalty(prof: str, mask: int) -> int:
+        if max_pause[mask] is None:
+            return 0
+        return max(max_pause[mask] - 2 - State.CONSTRAINTS[prof][PAUSE], 0) * SOFT_QUOTIENT
+
+    # the classrooms (index in the layout) where each professor can teach one of its subjects
+    prof_rooms = {prof: [r for r, classroom in enumerate(layout.rooms) if set(State.PROF_SUBS[prof]) & set(State.CLASSROOMS[classroom][MATERII])]
+                  for prof in State.PROF_SUBS}
+
+    heuristic = heuristic_timetable(initial)
+    if print_flag and heuristic is not None:
+        print(f"\tHeuristic timetable -> soft penalty: {heuristic.fitness['c_soft'] + heuristic.fitness['c_pause']}")
+
+    best = {'state': None, 'soft': float('inf')}
+    nodes = 0
+    stopped = False
+    group, group_profs = [], set() # the group searched and its professors
+    outside, floor = 0, 0 # c_pause of the professors of the other groups, the lowest soft penalty the group can reach
+
+    def options(subject: str) -> list:
+        '''
+            Returns the classes (cell index, capacity, professor, penalty) that can still be added for the subject
+        '''
+        result = []
+        for idx, cap, profs in domains[subject]:
+            if occupied[idx] or idx in excluded[subject]:
+                continue
+            day, interval, _ = cells[idx]
+            for prof in profs:
+                if state.prof_busy[prof] & slot_bits[idx] or state.prof_load[prof] >= 7:
+                    continue
+                result.append((idx, cap, prof, penalty[(prof, day, interval)]))
+        return result
+
+    def pause_gaps() -> list:
+        '''
+            Returns the (penalty, professor, day index, interval index) of the free slots of the professors strictly inside a day
+            with a c_pause penalty -> the only extra classes that can lower c_pause (see extras)
+        '''
+        gaps = []
+        for prof in group_profs:
+            if State.CONSTRAINTS[prof][PAUSE] is None or state.prof_load[prof] >= 7:
+                continue
+            busy = state.prof_busy[prof]
+            for d, day in enumerate(layout.days):
+                mask = (busy >> (d * layout.num_intervals)) & layout.day_mask
+                if pause_penalty(prof, mask) == 0:
+                    continue
+                first, last = (mask & -mask).bit_length() - 1, mask.bit_length() - 1
+                for i in range(first + 1, last):
+                    if not mask & (1 << i) and (prof, d, i) not in excluded_gaps:
+                        gaps.append((penalty[(prof, day, layout.intervals[i])], prof, d, i))
+        return gaps
+
+    def pause_bound() -> int:
+        '''
+            Lower bound of the c_pause penalty of the professors of the group: classes added outside the day of a professor
+            don t shorten its pauses -> the pauses are at least the ones left when every free slot inside the day (with a free
+            classroom, not excluded) gets a class
+        '''
+        bound = 0
+        for prof in group_profs:
+            if State.CONSTRAINTS[prof][PAUSE] is None:
+                continue
+            busy = state.prof_busy[prof]
+            for d in range(len(layout.days)):
+                mask = (busy >> (d * layout.num_intervals)) & layout.day_mask
+                if pause_penalty(prof, mask) == 0:
+                    continue
+
+                if state.prof_load[prof] < 7:
+                    first, last = (mask & -mask).bit_length() - 1, mask.bit_length() - 1
+                    for i in range(first + 1, last):
+                        base = (d * layout.num_intervals + i) * layout.num_rooms
+                        if not mask & (1 << i) and (prof, d, i) not in excluded_gaps and any(not occupied[base + r] for r in prof_rooms[prof]):
+                            mask |= 1 << i
+                bound += pause_penalty(prof, mask)
+        return bound
+
+    def extras():
+        '''
+            Searches the extra classes of a timetable that covers every subject, one professor and slot at a time: the slot either
+            gets a class of the professor (one branch per free classroom) or is excluded for the professor
+
+            Only the free slots inside a day of a professor with a c_pause penalty are tried: in a best timetable with the fewest
+            classes, every extra class is inside the day of its professor (the first and the last class of a day can be removed
+            without a longer pause) and a pause that is short enough only gets shorter when more classes are added inside the day
+            c_soft never decreases when classes are added -> it bounds the soft penalty of the subtree
+        '''
+        nonlocal nodes, stopped
+        node_excluded = [] # (professor, day, interval) excluded in this node -> restored when leaving it
+
+        try:
+            while True:
+                soft = state.fitness['c_soft'] + state.fitness['c_pause']
+                if soft < best['soft']:
+                    best['state'], best['soft'] = state.clone(), soft
+                    if print_flag:
+                        print(f"\tNode {nodes} -> soft penalty: {soft}")
+
+                gaps = pause_gaps()
+                if best['soft'] <= floor or not gaps or state.fitness['c_soft'] + outside + pause_bound() >= best['soft']:
+                    return
+
+                # the cheapest slot
+                pen, prof, d, i = min(gaps)
+                if state.fitness['c_soft'] + pen >= best['soft']:
+                    return
+
+                day, interval = layout.days[d], layout.intervals[i]
+                base = (d * layout.num_intervals + i) * layout.num_rooms
+                for idx in range(base, base + layout.num_rooms):
+                    subjects = [subject for subject in State.PROF_SUBS[prof] if subject in State.CLASSROOMS[cells[idx][2]][MATERII]]
+                    if occupied[idx] or not subjects:
+                        continue
+
+                    nodes += 1
+                    if max_nodes is not None and nodes > max_nodes:
+                        stopped = True
+                        return
+
+                    occupied[idx] = True
+                    state.push_move(day, interval, cells[idx][2], prof, subjects[0])
+                    extras()
+                    state.pop_move()
+                    occupied[idx] = False
+
+                    if stopped or best['soft'] <= floor:
+                        return
+
+                # the professor doesn t teach in the slot
+                excluded_gaps.add((prof, d, i))
+                node_excluded.append((prof, d, i))
+
+                nodes += 1
+                if max_nodes is not None and nodes > max_nodes:
+                    stopped = True
+                    return
+        finally:
+            for gap in node_excluded:
+                excluded_gaps.discard(gap)
+
+    def search():
+        '''
+            Searches the subtree of the current state; the exclude branches of the node are walked in a loop (not
+            recursively), so the recursion depth is the number of classes added
+        '''
+        nonlocal nodes, stopped
+        node_excluded = [] # (subject, cell) excluded in this node -> restored when leaving it
+
+        try:
+            while True:
+                nodes += 1
+                if max_nodes is not None and nodes > max_nodes:
+                    stopped = True
+                    return
+
+                uncovered = [subject for subject in group if subject not in state.covered]
+                if not uncovered:
+                    extras()
+                    return
+
+                # forward checking + lower bound of the soft penalty
+                bound = state.fitness['c_soft'] + outside + pause_bound()
+                chosen, chosen_options, chosen_key = None, None, None
+                free_cells, needed = {}, {}
+                for subject in uncovered:
+                    subject_options = options(subject)
+                    left = State.SUBJECTS[subject][NUM_STUDENTS] - state.students[subject]
+
+                    # the capacity of the free cells (each counted once) can t hold the students left
+                    capacity = {}
+                    for idx, cap, _, _ in subject_options:
+                        capacity[idx] = cap
+                    if sum(capacity.values()) < left:
+                        return
+
+                    # the professors of the subject can t teach the classes it still needs
+                    needed[subject] = min_classes(capacity.values(), left)
+                    if sum(7 - state.prof_load[prof] for prof in State.SUBJECTS[subject][PROF_FOR_SUBJECT]) < needed[subject]:
+                        return
+                    free_cells[subject] = capacity.keys()
+
+                    bound += cover_bound(subject_options, left)
+
+                    key = (len(capacity), -len(neighbours[subject] & set(uncovered)))
+                    if chosen_key is None or key < chosen_key:
+                        chosen, chosen_options, chosen_key = subject, subject_options, key
+
+                # the free cells of a group of subjects sharing classrooms can t hold the classes they still need together
+                for subjects in joint:
+                    subjects = [subject for subject in subjects if subject in needed]
+                    if len(subjects) > 1 and len(set().union(*(free_cells[subject] for subject in subjects))) < sum(needed[subject] for subject in subjects):
+                        return
+
+                if bound >= best['soft']:
+                    return
+
+                # the cheapest class (soft penalty and pause, by its fitness delta), then the biggest classroom
+                costs = {}
+                for idx, cap, prof, _ in chosen_options:
+                    delta = state.move_delta(*cells[idx], prof, chosen)
+                    costs[(idx, prof)] = (delta['c_soft'] + delta['c_pause'], -cap, idx)
+                idx = min(costs.values())[2]
+                day, interval, classroom = cells[idx]
+
+                # the cell gets a class of the subject -> cheapest professors first
+                occupied[idx] = True
+                for prof in sorted((option[2] for option in chosen_options if option[0] == idx), key=lambda prof: costs[(idx, prof)]):
+                    state.push_move(day, interval, classroom, prof, chosen)
+                    search()
+                    state.pop_move()
+
+                    # a timetable with the lowest soft penalty of the group can t be improved
+                    if stopped or best['soft'] <= floor:
+                        occupied[idx] = False
+                        return
+                occupied[idx] = False
+
+                # the cell doesn t get a class of the subject
+                excluded[chosen].add(idx)
+                node_excluded.append((chosen, idx))
+        finally:
+            for subject, idx in node_excluded:
+                excluded[subject].discard(idx)
+
+    def prof_pause(prof: str) -> int:
+        '''
+            Returns the c_pause penalty of a professor in the current state
+        '''
+        if State.CONSTRAINTS[prof][PAUSE] is None:
+            return 0
+        return sum(pause_penalty(prof, (state.prof_busy[prof] >> (d * layout.num_intervals)) & layout.day_mask) for d in range(len(layout.days)))
+
+    # the groups are searched one after the other, each from the best timetable of the previous ones
+    for group in groups:
+        group_profs = {prof for subject in group for prof in State.SUBJECTS[subject][PROF_FOR_SUBJECT]}
+        outside = sum(prof_pause(prof) for prof in State.CONSTRAINTS if prof not in group_profs)
+        floor = state.fitness['c_soft'] + outside
+        best = {'state': None, 'soft': float('inf')}
+
+        # the classes of the heuristic timetable in the group -> the timetable to beat
+        if heuristic is not None:
+            candidate = state.clone()
+            for day, interval, classroom in cells:
+                new_class = heuristic.timetable[day][interval][classroom]
+                if new_class is not None and new_class[0] in group_profs and candidate.timetable[day][interval][classroom] is None:
+                    candidate.push_move(day, interval, classroom, *new_class)
+            candidate.commit()
+            if all(subject in candidate.covered for subject in group):
+                best = {'state': candidate, 'soft': candidate.fitness['c_soft'] + candidate.fitness['c_pause']}
+
+        search()
+
+        if best['state'] is None:
+            if print_flag:
+                print(f"\t{'No timetable found' if stopped else 'Infeasible: no timetable without hard constraint violations'} ({nodes} nodes)")
+            return False, nodes, nodes, state
+
+        best['state'].commit()
+        state = best['state']
+        occupied = [state.timetable[day][interval][classroom] is not None for day, interval, classroom in cells]
+
+    if print_flag:
+        proof = "not proven optimal (node limit reached)" if stopped else "optimal"
+        print(f"\tBest soft penalty: {best['soft']} -> {proof} ({nodes} nodes)")
+
+    return state.is_final(), nodes, nodes, state
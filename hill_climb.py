@@ -1,9 +1,88 @@
 import math as m
+import random as r
+import multiprocessing as mp
 
 from state import State
 
 
-def hill_climbing_first_X(initial: State, max_iters: int = 200, *, X: int = 50):
+class VisitedTable:
+    '''
+        Bounded table of the (Zobrist) hashes of the visited states -> the oldest hashes are forgotten first
+    '''
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self.hashes = {} # dict -> keeps the insertion order
+
+    def add(self, state_hash: int):
+        self.hashes.pop(state_hash, None)
+        self.hashes[state_hash] = None
+        if len(self.hashes) > self.max_size:
+            del self.hashes[next(iter(self.hashes))]
+
+    def __contains__(self, state_hash: int) -> bool:
+        return state_hash in self.hashes
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+def best_batch_move(state: State, X: int = None, visited: VisitedTable = None):
+    '''
+        Scores the whole neighbourhood of the state at once (State.score_neighbourhood) and returns (best move, number of scored moves)
+        If X is given, the best move is chosen from X random better moves (like hill_climbing_first_X), otherwise from all of them
+        The best move is None if there is no better move (that leads to a state which was not visited)
+    '''
+    candidates, deltas = state.score_neighbourhood()
+
+    better = (deltas < 0).nonzero()[0]
+    if len(better) == 0:
+        return None, len(deltas)
+
+    if X is not None and len(better) > X:
+        better = better[r.sample(range(len(better)), X)]
+
+    if visited is None:
+        best = better[deltas[better].argmin()]
+        return State.candidate_move(candidates[best]), len(deltas)
+
+    # best move that doesn t lead to a visited state
+    for best in better[deltas[better].argsort(kind='stable')]:
+        move = State.candidate_move(candidates[best])
+        if state.move_hash(*move) not in visited:
+            return move, len(deltas)
+    return None, len(deltas)
+
+
+def best_operator_move(state: State, X: int = None, visited: VisitedTable = None):
+    '''
+        Scores the relocate and swap moves of the state (State.get_relocate_moves / get_swap_moves) and returns (best moves, number of scored moves)
+        If X is given, the best moves are chosen from the first X better ones, otherwise from all of them
+        The best moves are None if there is no better move
+    '''
+    cur_fitness = state.total_fitness()
+    best_moves, best_fitness = None, cur_fitness
+    num_scored, num_better = 0, 0
+
+    for generator in (state.get_relocate_moves(), state.get_swap_moves()):
+        for moves in generator:
+            # the state was already visited -> skip
+            if visited is not None and state.moves_hash(moves) in visited:
+                continue
+
+            num_scored += 1
+            next_fitness = cur_fitness + sum(state.moves_delta(moves).values())
+            if next_fitness < cur_fitness:
+                num_better += 1
+                if next_fitness < best_fitness:
+                    best_moves, best_fitness = moves, next_fitness
+                if num_better == X:
+                    return best_moves, num_scored
+
+    return best_moves, num_scored
+
+
+def hill_climbing_first_X(initial: State, max_iters: int = 200, *, X: int = 50, batch: bool = False, visited: VisitedTable = None,
+                          operators: bool = False):
     '''
         Hill climbing algorithm that chooses the best X states from the better states -> faster than the normal hill climbing, but less accurate
         Reference values for X:
@@ -12,38 +91,81 @@ def hill_climbing_first_X(initial: State, max_iters: int = 200, *, X: int = 50):
             - ~100 for orar_mediu
             - ~50 for orar_mic
             - ~10 for dummy
+        If batch is True, the neighbourhood is scored at once with numpy (see best_batch_move)
+        If visited is given, the moves that lead to already visited states are skipped without scoring them
+        If operators is True, the relocate and swap moves are tried when no other move is better (see best_operator_move)
     '''
     iters, num_states = 0, 0
     state = initial.clone()
+    if visited is not None:
+        visited.add(state.zobrist)
 
     while iters < max_iters:
         iters += 1
 
-        cur_state = state
+        if batch:
+            best_move, num_scored = best_batch_move(state, X, visited)
+            num_states += num_scored
+        else:
+            cur_fitness = state.total_fitness()
 
-        better_states = []  # pair of (state, fitness)
-        num_of_better_states = 0
+            better_moves = []  # pair of (move, fitness)
+            num_of_better_moves = 0
 
-        for next_state in cur_state.get_next_states_hc():
-            num_states += 1
-            if next_state.total_fitness() < cur_state.total_fitness():
-                better_states.append((next_state, next_state.total_fitness()))
-                num_of_better_states += 1
-            
-            if num_of_better_states == X:
-                break
+            # score the neighbours by their fitness delta and only build the chosen move
+            for move in state.get_next_moves_hc():
+                # the state was already visited -> skip
+                if visited is not None and state.move_hash(*move) in visited:
+                    continue
+
+                num_states += 1
+                next_fitness = cur_fitness + sum(state.move_delta(*move).values())
 
-        if num_of_better_states > 0:
-            state = min(better_states, key=lambda x: x[1])[0] # choose the best state from the first x better states
+                if next_fitness < cur_fitness:
+                    better_moves.append((move, next_fitness))
+                    num_of_better_moves += 1
+                
+                if num_of_better_moves == X:
+                    break
+
+            best_move = min(better_moves, key=lambda x: x[1])[0] if num_of_better_moves > 0 else None # choose the best move from the first x better moves
+
+        if best_move is not None:
+            state.push_move(*best_move)
+        elif operators:
+            best_moves, num_scored = best_operator_move(state, X, visited)
+            num_states += num_scored
+            if best_moves is None:
+                break
+            state.push_moves(best_moves)
         else:
             break
 
+        state.commit()
+        if visited is not None:
+            visited.add(state.zobrist)
+
     return state.is_final(), iters, num_states, state
 
 
-def hill_climbing_random_restart(initial: State, max_iters: int = 200, max_restarts: int = 10, print_flag: bool = True):
+def _restart_worker(args: tuple):
+    '''
+        Runs one random restart in a process of the pool, with its own random seed
+    '''
+    i, initial, max_iters, X, batch, operators, seed = args
+    r.seed(seed)
+    is_final, iters, num_states, state = hill_climbing_first_X(initial, max_iters, X=X, batch=batch, operators=operators)
+    return i, X, is_final, iters, num_states, state
+
+
+def hill_climbing_random_restart(initial: State, max_iters: int = 200, max_restarts: int = 10, print_flag: bool = True, batch: bool = False,
+                                 tabu_size: int = 0, workers: int = 1, operators: bool = False):
     '''
         Hill climbing algorithm that restarts the search from a random state if the found state is not final
+        If tabu_size > 0, the restarts share a table of the last tabu_size visited states and don t wander back into them
+        If workers > 1, the restarts run in parallel in a pool of processes (each with its own seed and X), and all of
+        them are stopped as soon as one finds a final state (tabu_size is ignored -> the restarts can t share the table)
+        If operators is True, the restarts also use the relocate and swap moves (see hill_climbing_first_X)
     '''
 
     def compute_start_X(bfactor: int) -> int:
@@ -76,8 +198,35 @@ def hill_climbing_random_restart(initial: State, max_iters: int = 200, max_resta
     best_state = initial.clone()
     total_iters, total_states = 0, 0
 
+    if workers > 1:
+        # the X schedule is the same as in the sequential search
+        schedule = []
+        for i in range(max_restarts):
+            schedule.append(X)
+            X = round(X * R)
+
+        tasks = [(i, initial, max_iters, schedule[i], batch, operators, r.getrandbits(64)) for i in range(max_restarts)]
+        with mp.Pool(workers, initializer=State.import_env, initargs=(State.export_env(),)) as pool:
+            # leaving the with block terminates the workers that are still running
+            for i, X, is_final, iters, num_states, state in pool.imap_unordered(_restart_worker, tasks):
+                total_iters += iters
+                total_states += num_states
+
+                if print_flag:
+                    print(f"\tFinished random restart {i + 1} / {max_restarts} [first {X} states] -> fitness: {state.total_fitness()}")
+
+                if state.total_fitness() < best_state.total_fitness():
+                    best_state = state
+
+                if is_final:
+                    return is_final, total_iters, total_states, state
+
+        return False, total_iters, total_states, best_state
+
+    visited = VisitedTable(tabu_size) if tabu_size > 0 else None
+
     for i in range(max_restarts):
-        is_final, iters, num_states, state = hill_climbing_first_X(initial, max_iters, X=X)
+        is_final, iters, num_states, state = hill_climbing_first_X(initial, max_iters, X=X, batch=batch, visited=visited, operators=operators)
         total_iters += iters
         total_states += num_states
 
@@ -96,9 +245,11 @@ def hill_climbing_random_restart(initial: State, max_iters: int = 200, max_resta
     return False, total_iters, total_states, best_state
         
 
-def hill_climbing(initial: State, max_iters: int = 200):
+def hill_climbing(initial: State, max_iters: int = 200, batch: bool = False, operators: bool = False):
     '''
         Classic hill climbing algorithm
+        If batch is True, the neighbourhood is scored at once with numpy (see best_batch_move)
+        If operators is True, the relocate and swap moves are tried when no other move is better (see best_operator_move)
     '''
     iters, num_states = 0, 0
     state = initial.clone()
@@ -106,16 +257,31 @@ def hill_climbing(initial: State, max_iters: int = 200):
     while iters < max_iters:
         iters += 1
 
-        cur_state = state
+        if batch:
+            best_move, num_scored = best_batch_move(state)
+            num_states += num_scored
+        else:
+            cur_fitness = state.total_fitness()
+            best_move, best_fitness = None, cur_fitness
+
+            for move in state.get_next_moves_hc():
+                num_states += 1
+                next_fitness = cur_fitness + sum(state.move_delta(*move).values())
 
-        for next_state in cur_state.get_next_states_hc():
-            num_states += 1
-            if next_state.total_fitness() < cur_state.total_fitness():
-                cur_state = next_state
+                if next_fitness < best_fitness:
+                    best_move, best_fitness = move, next_fitness
 
-        if cur_state == state:
+        if best_move is not None:
+            state.push_move(*best_move)
+        elif operators:
+            best_moves, num_scored = best_operator_move(state)
+            num_states += num_scored
+            if best_moves is None:
+                break
+            state.push_moves(best_moves)
+        else:
             break
 
-        state = cur_state
+        state.commit()
 
     return state.is_final(), iters, num_states, state
@@ -0,0 +1,186 @@
+import json
+
+from functools import wraps
+from time import perf_counter
+
+from state import State
+
+STATS = None # the Instrumentation of the run, None -> instrumentation off
+
+
+class Instrumentation:
+    '''
+        Counters and timers (in seconds) of a run, by name
+    '''
+    def __init__(self) -> None:
+        self.counters = {}
+        self.timers = {}
+        self.nested = 0 # number of wrapped moves/evaluations running -> the evaluations they make are not neighbours
+
+
+    def count(self, name: str, n: int = 1):
+        '''
+            Adds n to a counter
+        '''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def add_time(self, name: str, seconds: float):
+        '''
+            Adds the given time to a timer
+        '''
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+
+    def lap(self, name: str, start: float) -> float:
+        '''
+            Adds the time since start to a timer and returns the current time -> the start of the next phase
+        '''
+        now = perf_counter()
+        self.timers[name] = self.timers.get(name, 0.0) + now - start
+        return now
+
+
+    def to_dict(self) -> dict:
+        '''
+            Returns the counters and timers as a JSON serializable dict
+        '''
+        return {'counters': dict(sorted(self.counters.items())), 'timers': dict(sorted(self.timers.items()))}
+
+
+    def dump(self, path: str):
+        '''
+            Writes the counters and timers to a JSON file
+        '''
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+    def __str__(self):
+        '''
+            Returns the counters and timers, one per line
+        '''
+        lines = [f"\t{name}: {value}" for name, value in sorted(self.counters.items())]
+        lines += [f"\t{name}: {value:.4f}s" for name, value in sorted(self.timers.items())]
+        return '\n'.join(lines)
+
+
+def _counted(stats: Instrumentation, name: str, function):
+    ''' Returns function, counting its calls '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        stats.count(name)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def _applied(stats: Instrumentation, name: str, function):
+    ''' Returns the move function, counting its calls (the fitness deltas it computes itself are not counted as evaluated neighbours) '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        stats.count(name)
+        stats.nested += 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.nested -= 1
+    return wrapper
+
+
+def _evaluated(stats: Instrumentation, name: str, function):
+    ''' Returns the fitness delta function, counting the calls made by the search (not the ones made by other moves or deltas) '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if stats.nested == 0:
+            stats.count(name)
+        stats.nested += 1
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.nested -= 1
+    return wrapper
+
+
+def _timed(stats: Instrumentation, name: str, function):
+    ''' Returns function, counting its calls and timing them '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        stats.count(name)
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.add_time(name, perf_counter() - start)
+    return wrapper
+
+
+def _generated(stats: Instrumentation, name: str, function):
+    ''' Returns the move generator function, counting the moves it yields '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        for move in function(*args, **kwargs):
+            stats.count(name)
+            yield move
+    return wrapper
+
+
+def _scored(stats: Instrumentation, name: str, function):
+    ''' Returns score_neighbourhood, counting the moves it scores (all generated and evaluated at once) '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        candidates, deltas = function(*args, **kwargs)
+        stats.count(f"{name}.generated", len(candidates))
+        stats.count(f"{name}.evaluated", len(candidates))
+        return candidates, deltas
+    return wrapper
+
+
+# the wrapped methods of State: name in the class -> (name of the counter/timer, wrapper)
+# the fitness is updated incrementally (move_delta, __set_class) -> the c_pause and c_stud_left work of each move is timed
+# in the private functions they call (__pause_penalty, __stud_deficit), reached through their mangled names
+_WRAPPERS = {
+    'apply_move': ('State.apply_move', _counted),
+    'push_move': ('State.push_move', _applied),
+    'move_delta': ('neighbours.evaluated', _evaluated),
+    'moves_delta': ('neighbours.evaluated', _evaluated),
+    '_State__pause_penalty': ('c_pause.__pause_penalty', _timed),
+    '_State__stud_deficit': ('c_stud_left.__stud_deficit', _timed),
+    'get_next_moves_hc': ('neighbours.generated', _generated),
+    'score_neighbourhood': ('neighbours', _scored),
+}
+_originals = {} # name in the class -> original attribute of State
+
+
+def enable() -> Instrumentation:
+    '''
+        Turns the instrumentation on and returns its Instrumentation
+        The methods of State are replaced by wrappers that count and time them -> when it is off, State runs its
+        own methods and the search pays nothing (mcts only checks STATS between its phases)
+        Only the current process is instrumented (not the workers of a pool)
+    '''
+    global STATS
+    if STATS is not None:
+        return STATS
+
+    STATS = Instrumentation()
+    for name, (stat_name, wrap) in _WRAPPERS.items():
+        original = State.__dict__[name]
+        _originals[name] = original
+        if isinstance(original, staticmethod):
+            setattr(State, name, staticmethod(wrap(STATS, stat_name, original.__func__)))
+        else:
+            setattr(State, name, wrap(STATS, stat_name, original))
+    return STATS
+
+
+def disable() -> Instrumentation:
+    '''
+        Turns the instrumentation off (restores the methods of State) and returns the Instrumentation of the run
+    '''
+    global STATS
+    stats = STATS
+    for name, original in _originals.items():
+        setattr(State, name, original)
+    _originals.clear()
+    STATS = None
+    return stats
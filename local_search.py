@@ -0,0 +1,147 @@
+import math as m
+import random as r
+
+from my_utils import *
+from state import State
+
+
+def repair_moves(state: State):
+    '''
+        Lazily generates the moves that change the classes already in the timetable: the same subject
+        with another (free) professor, or an empty classroom
+        get_next_moves_hc skips the covered subjects -> without these moves the search stops as soon as every subject is covered
+    '''
+    cells = [(day, interval, classroom)
+             for day in state.timetable for interval in state.timetable[day] for classroom in state.timetable[day][interval]
+             if state.timetable[day][interval][classroom] is not None]
+    r.shuffle(cells)
+
+    for day, interval, classroom in cells:
+        prof, subject = state.timetable[day][interval][classroom]
+        slot_bit = 1 << State.LAYOUT.slot_idx[(day, interval)]
+
+        profs = State.SUBJECTS[subject][PROF_FOR_SUBJECT]
+        for other in r.sample(profs, len(profs)):
+            if other != prof and not state.prof_busy[other] & slot_bit:
+                yield (day, interval, classroom, other, subject)
+
+        yield (day, interval, classroom, None, None)
+
+
+def next_moves(state: State):
+    '''
+        Neighbourhood of the local search: the moves of get_next_moves_hc, the repair moves and the relocate
+        and swap moves of the state, interleaved
+        Every neighbour is a tuple of moves (see State.moves_delta)
+    '''
+    generators = [
+        ((move,) for move in state.get_next_moves_hc()),
+        ((move,) for move in repair_moves(state)),
+        state.get_relocate_moves(),
+        state.get_swap_moves()
+    ]
+    while generators:
+        for generator in list(generators):
+            moves = next(generator, None)
+            if moves is None:
+                generators.remove(generator)
+            else:
+                yield moves
+
+
+def simulated_annealing(initial: State, max_iters: int = 20000, *, t0: float = 2.0, alpha: float = 0.995, t_min: float = 0.05,
+                        max_tries: int = 200, print_flag: bool = False):
+    '''
+        Simulated annealing over the local search neighbourhood (see next_moves)
+        Each iteration walks the (shuffled) neighbours and takes the first one that is accepted:
+            - always, if it doesn t increase the fitness
+            - with a probability of exp(-delta / T), otherwise
+        Cooling schedule: T starts at t0 and is multiplied by alpha after each iteration, down to t_min
+        (t0 ~ 2 lets the search pay for soft constraints, but almost never for hard ones)
+        max_tries is the number of neighbours scored in an iteration before giving up on it
+        Returns the best state found
+    '''
+    iters, num_states = 0, 0
+    state = initial.clone()
+    best_state, best_fitness = state.clone(), state.total_fitness()
+    temperature = t0
+
+    while iters < max_iters and not state.is_final():
+        iters += 1
+
+        tries = 0
+        for moves in next_moves(state):
+            if tries == max_tries:
+                break
+            tries += 1
+
+            num_states += 1
+            delta = sum(state.moves_delta(moves).values())
+
+            if delta <= 0 or r.random() < m.exp(-delta / temperature):
+                state.push_moves(moves)
+                state.commit()
+                break
+
+        # no neighbours at all -> nothing else to do
+        if tries == 0:
+            break
+
+        if state.total_fitness() < best_fitness:
+            best_state, best_fitness = state.clone(), state.total_fitness()
+            if print_flag:
+                print(f"\tIter {iters} | T {temperature:.3f} -> fitness: {best_fitness}")
+
+        temperature = max(t_min, temperature * alpha)
+
+    return best_state.is_final(), iters, num_states, best_state
+
+
+def tabu_search(initial: State, max_iters: int = 2000, *, tenure: int = 10, X: int = 300, print_flag: bool = False):
+    '''
+        Tabu search over the local search neighbourhood (see next_moves)
+        Each iteration scores (at most) X neighbours and moves to the best one, even if it is worse than the current state
+        The (day, interval, classroom) cells changed by a move are tabu for the next tenure iterations -> the search can t undo it right away
+        Aspiration: a tabu move is still taken if it leads to a state better than the best one found
+        Returns the best state found
+    '''
+    iters, num_states = 0, 0
+    state = initial.clone()
+    best_state, best_fitness = state.clone(), state.total_fitness()
+    tabu = {} # (day, interval, classroom) -> last iteration in which it is tabu
+
+    while iters < max_iters and not state.is_final():
+        iters += 1
+
+        cur_fitness = state.total_fitness()
+        best_move, best_move_fitness = None, float('inf')
+
+        for tries, moves in enumerate(next_moves(state)):
+            if tries == X:
+                break
+
+            num_states += 1
+            next_fitness = cur_fitness + sum(state.moves_delta(moves).values())
+
+            is_tabu = any(tabu.get(move[:3], 0) >= iters for move in moves)
+            if is_tabu and next_fitness >= best_fitness:
+                continue
+
+            if next_fitness < best_move_fitness:
+                best_move, best_move_fitness = moves, next_fitness
+
+        # every neighbour is tabu (or there are none)
+        if best_move is None:
+            break
+
+        state.push_moves(best_move)
+        state.commit()
+        for move in best_move:
+            tabu[move[:3]] = iters + tenure
+
+        if state.total_fitness() < best_fitness:
+            best_state, best_fitness = state.clone(), state.total_fitness()
+            if print_flag:
+                print(f"\tIter {iters} -> fitness: {best_fitness}")
+
+    return best_state.is_final(), iters, num_states, best_state
@@ -1,10 +1,22 @@
+import random as r
+import multiprocessing as mp
+
+from contextlib import nullcontext
 from math import sqrt, log
 from random import choice
+from time import perf_counter
 from state import State
+import instrumentation
 
 class Node:
-    def __init__(self, state, parent=None) -> None:
-        self.state = state
+    '''
+        Node of the search tree -> only the action that leads to it and its statistics (no State)
+        The state of a node is rebuilt by replaying the actions from the root (see mcts)
+    '''
+    __slots__ = ('action', 'parent', 'actions', 'quality', 'visits')
+
+    def __init__(self, action=None, parent=None) -> None:
+        self.action = action # the action applied to the state of the parent
         self.parent = parent
         self.actions = {} # dict of actions -> Node (child nodes)
         self.quality = 0
@@ -84,65 +96,115 @@ def select_action(node, c=CP):
     return max(node.actions.keys(), key=lambda action: uct(node.actions[action].quality, node.actions[action].visits, node.visits, c=c))
 
 
-def mcts(state0: State, budget: int, tree: Node):
+def rollout(state: State):
+    '''
+        Simulates a game with random actions from the given state
+        Returns the reward of the final state and the number of states generated
+    '''
+    num_states = 0
+    while not is_final(state):
+        action = state.get_random_action()
+        if not action:
+            break
+        state = state.apply_move(*action, depth=state.depth + 1)
+        num_states += 1
+    return compute_reward(state), num_states
+
+
+def mcts(state0: State, budget: int, tree: Node, return_root: bool = False, rollouts: int = 1, pool=None):
     '''
         MCTS algorithm
         Params:
             state0: initial state
             budget: number of iterations
             tree: the tree to use
+            return_root: also return the root of the tree (used by the root parallel MCTS)
+            rollouts: number of rollouts from each expanded leaf; the nodes get their sum of rewards and a visit per rollout
+            pool: if given, the rollouts of a leaf run in parallel in it (leaf parallel MCTS)
     '''
-    # if there is a tree, use it
+    # if there is a tree, use it (its root is the node of state0)
     if tree:
         root = tree
         root.parent = None # forget the parent -> less calculations for backpropagation
     else:
-        root = Node(state0)
+        root = Node()
 
     num_states = 0
 
+    # the state of the current node -> the actions are pushed into it on the way down and popped at the end of the iteration
+    state = state0.clone()
+
+    # phase timers, only if the instrumentation is on
+    stats = instrumentation.STATS
+
     for i in range(budget):
         node = root
+        num_pushed = 0
+        if stats is not None:
+            stats.count('mcts.iterations')
+            clock = perf_counter()
 
         # Selection => find a leaf node
-        while not is_final(node.state) and all(act in node.actions for act in node.state.get_available_actions()):
+        while not is_final(state) and all(act in node.actions for act in state.get_available_actions()):
             action = select_action(node)
             # this is for depth too small
             if action is None:
                 break
             node = node.actions[action]
+            state.push_move(*action)
+            state.depth += 1
+            num_pushed += 1
+        if stats is not None:
+            clock = stats.lap('mcts.selection', clock)
 
 
         # Expansion => expand the leaf node
-        available_actions = node.state.get_available_actions()
-        if not is_final(node.state) and not all(act in node.actions for act in available_actions):
+        available_actions = state.get_available_actions()
+        if not is_final(state) and not all(act in node.actions for act in available_actions):
             possible_actions = [a for a in available_actions if a not in node.actions]
             action = choice(possible_actions)
 
-            new_state = node.state.apply_move(*action, depth=node.state.depth + 1)
+            state.push_move(*action)
+            state.depth += 1
+            num_pushed += 1
             num_states += 1
-            node.actions[action] = Node(new_state, parent=node)
+            node.actions[action] = Node(action, parent=node)
 
             node = node.actions[action]
+        if stats is not None:
+            clock = stats.lap('mcts.expansion', clock)
 
 
-        # Simulation => simulate a game from the current state
-        state = node.state
-        while not is_final(state):
-            action = state.get_random_action()
-            if not action:
-                break
-            state = state.apply_move(*action, depth=state.depth + 1)
-            num_states += 1
+        # Simulation => simulate games from the current state
+        if pool is not None and rollouts > 1:
+            leaf = state.clone() # without the undo log
+            tasks = [(leaf, r.getrandbits(64)) for _ in range(rollouts)]
+            results = pool.map(_rollout_worker, tasks)
+        else:
+            results = [rollout(state) for _ in range(rollouts)]
+        num_states += sum(cur_num_states for _, cur_num_states in results)
+        if stats is not None:
+            clock = stats.lap('mcts.simulation', clock)
 
 
         # Backpropagation => update the quality and visits of the nodes
-        reward = compute_reward(state)
+        # a visit per rollout and their summed rewards -> quality / visits stays the mean reward of the node
+        reward = sum(cur_reward for cur_reward, _ in results)
         while node:
-            node.visits += 1
+            node.visits += rollouts
             node.quality += reward
             node = node.parent
 
+        # back to state0
+        for _ in range(num_pushed):
+            state.pop_move()
+        state.depth = state0.depth
+        if stats is not None:
+            stats.lap('mcts.backpropagation', clock)
+
+
+    if return_root:
+        return None, None, num_states, root
 
     final_action = select_action(root, c=0.0)
     if final_action is None:
@@ -150,32 +212,90 @@ def mcts(state0: State, budget: int, tree: Node):
     return final_action, root.actions[final_action], num_states
 
 
-def run_mcts(state: State, debug_flag=False):
+def _init_mcts_worker(env: dict, max_depth: int):
     '''
-        Runs the MCTS algorithm
+        Initializes a process of the root / leaf parallel pool with the environment of the parent
+    '''
+    global MAX_DEPTH
+    MAX_DEPTH = max_depth
+    State.import_env(env)
+
+
+def _rollout_worker(args: tuple):
+    '''
+        Runs a rollout in a process of the leaf parallel pool
     '''
-    BUDGET = 50
+    state, seed = args
+    r.seed(seed)
+    return rollout(state)
 
+
+def _mcts_worker(args: tuple):
+    '''
+        Builds a tree from state0 in a process of the pool and returns the statistics of the root actions
+    '''
+    state0, budget, rollouts, seed = args
+    r.seed(seed)
+    _, _, num_states, root = mcts(state0, budget, None, return_root=True, rollouts=rollouts)
+    return {action: (child.visits, child.quality) for action, child in root.actions.items()}, root.visits, num_states
+
+
+def mcts_root_parallel(state0: State, budget: int, pool, workers: int, rollouts: int = 1):
+    '''
+        Root parallel MCTS: each worker builds its own tree from state0 with the given budget,
+        then the visits and quality of the root actions are merged before choosing the action
+        Returns the same as mcts, but without a tree to reuse (the trees stay in the workers)
+    '''
+    root = Node()
+    num_states = 0
+
+    tasks = [(state0, budget, rollouts, r.getrandbits(64)) for _ in range(workers)]
+    for stats, visits, cur_num_states in pool.map(_mcts_worker, tasks):
+        num_states += cur_num_states
+        root.visits += visits
+        for action, (child_visits, child_quality) in stats.items():
+            if action not in root.actions:
+                root.actions[action] = Node(action, parent=root)
+            root.actions[action].visits += child_visits
+            root.actions[action].quality += child_quality
+
+    return select_action(root, c=0.0), None, num_states
+
+
+def run_mcts(state: State, debug_flag=False, budget: int = 50, workers: int = 1, rollouts: int = 1):
+    '''
+        Runs the MCTS algorithm
+        If workers > 1, each decision is taken by root parallel MCTS (see mcts_root_parallel) -> an effective budget of workers * budget
+        rollouts is the number of rollouts from each expanded leaf; without root parallelism they run in a pool
+        of (at most) rollouts processes (leaf parallel MCTS), otherwise each tree runs them sequentially
+    '''
     global MAX_DEPTH
     MAX_DEPTH = compute_max_depth(state)
 
+    # the processes of the root parallel pool are daemonic -> they can't start their own rollout pools
+    pool_size = workers if workers > 1 else min(rollouts, mp.cpu_count())
+
     iters, num_states = 0, 0
 
     state = state.clone()
     tree = None
 
-    while state and not is_final(state):
-        iters += 1
-        action, tree, cur_num_states = mcts(state, BUDGET, tree)
-        num_states += cur_num_states
-        if action is None:
-            break
+    with (mp.Pool(pool_size, initializer=_init_mcts_worker, initargs=(State.export_env(), MAX_DEPTH)) if pool_size > 1 else nullcontext()) as pool:
+        while state and not is_final(state):
+            iters += 1
+            if workers > 1:
+                action, tree, cur_num_states = mcts_root_parallel(state, budget, pool, workers, rollouts=rollouts)
+            else:
+                action, tree, cur_num_states = mcts(state, budget, tree, rollouts=rollouts, pool=pool)
+            num_states += cur_num_states
+            if action is None:
+                break
 
-        if debug_flag:
-            print(f"\nApplying action: {action} -> depth: {state.depth}")
-            print(f"Fitness: {state.total_fitness_mcts()}\n")
+            if debug_flag:
+                print(f"\nApplying action: {action} -> depth: {state.depth}")
+                print(f"Fitness: {state.total_fitness_mcts()}\n")
 
-        state = state.apply_move(*action, depth=state.depth + 1)
+            state = state.apply_move(*action, depth=state.depth + 1)
 
     if debug_flag:
         print(f"Final state: {state}")
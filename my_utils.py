@@ -1,4 +1,4 @@
-import yaml, random
+import random
 
 from utils import MATERII
 
@@ -112,6 +112,8 @@ def pretty_print_dict(name: str, d: dict, marker: chr = '=') -> None:
     '''
         Pretty prints a dictionary
     '''
+    import yaml # only needed here -> not imported at startup
+
     print(f"\n{marker * 25}{name}{marker * 25}")
     print(yaml.dump(d, default_flow_style=False, indent=4))
     print(marker * (50 + len(name)))
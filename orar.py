@@ -1,5 +1,8 @@
-import os, sys
+import os, sys, argparse
+import random as r
+import multiprocessing as mp
 
+from contextlib import nullcontext
 from datetime import datetime
 from time import time
 from utils import *
@@ -7,13 +10,28 @@ from state import State, HARD_QUOTIENTS
 
 from hill_climb import hill_climbing_random_restart, hill_climbing_first_X, hill_climbing
 from mcts import run_mcts
+from local_search import simulated_annealing, tabu_search
+from exact import solve_exact
+import instrumentation
 
 VERSION = "final version"
 N_TRIALS = 1
 
 
-def run_test(algorithm: callable, input_file: str, n_trials: int, print_constraints: bool = False, **kwargs):
-    ''' Run n_trials tests for the given algorithm and input file '''
+def run_trial(args: tuple):
+    ''' Run one trial of the algorithm from the initial state (with its own seed, if given) '''
+    algorithm, trial, seed, greedy, kwargs = args
+    if seed is not None:
+        r.seed(seed)
+
+    initial = State.greedy_initial_state() if greedy else State()
+    is_final, iters, num_states, final_state = algorithm(initial, **kwargs)
+    return trial, is_final, iters, num_states, final_state
+
+
+def run_test(algorithm: callable, input_file: str, n_trials: int, print_constraints: bool = False, jobs: int = 1, greedy: bool = False, print_timetables: bool = True, **kwargs):
+    ''' Run n_trials tests for the given algorithm and input file (in a pool of jobs processes if jobs > 1), from the greedy initial state if greedy is True
+        If print_timetables is False, only the summary line of each trial is printed (the best timetable is still written to outputs/) '''
     wins, fails = 0, 0
     end_fitness = [0 for _ in range(n_trials)]
     total_states = 0
@@ -24,26 +42,34 @@ def run_test(algorithm: callable, input_file: str, n_trials: int, print_constrai
 
     best_state = None
     best_fitness = float('inf')
+    best_trial = n_trials
 
-    for trial in range(n_trials):
-        initial = State()
-        is_final, iters, num_states, final_state = algorithm(initial, **kwargs)
+    # the environment is loaded once and shipped to each worker, the results come back as the trials finish
+    with (mp.Pool(jobs, initializer=State.import_env, initargs=(State.export_env(),)) if jobs > 1 else nullcontext()) as pool:
+        if pool is not None:
+            results = pool.imap_unordered(run_trial, [(algorithm, trial, r.getrandbits(64), greedy, kwargs) for trial in range(n_trials)])
+        else:
+            results = (run_trial((algorithm, trial, None, greedy, kwargs)) for trial in range(n_trials))
 
-        total_states += num_states
+        for trial, is_final, iters, num_states, final_state in results:
+            total_states += num_states
 
-        if is_final:
-            wins += 1
-        else:
-            fails += 1
-            end_fitness[trial] = final_state.total_fitness()
+            if is_final:
+                wins += 1
+            else:
+                fails += 1
+                end_fitness[trial] = final_state.total_fitness()
 
-        if final_state.total_fitness() < best_fitness:
-            best_state = final_state
-            best_fitness = final_state.total_fitness()
+            # same best state as in sequential mode -> the first trial with the best fitness
+            if (final_state.total_fitness(), trial) < (best_fitness, best_trial):
+                best_state = final_state
+                best_fitness = final_state.total_fitness()
+                best_trial = trial
 
-        print('*' * 120)
-        print(f"Trial {trial + 1} | {'W' if is_final else 'L'} | ITERS {iters} | NUM_STATES {num_states} | FITNESS {end_fitness[trial]}")
-        print(final_state)
+            print('*' * 120)
+            print(f"Trial {trial + 1} | {'W' if is_final else 'L'} | ITERS {iters} | NUM_STATES {num_states} | FITNESS {end_fitness[trial]}")
+            if print_timetables:
+                print(final_state)
 
 
     # log the results
@@ -58,7 +84,8 @@ def run_test(algorithm: callable, input_file: str, n_trials: int, print_constrai
     out_file = f"outputs/{input_file.split('/')[-1]}".split('.')[0] + ".txt"
     print(f"Writing best state to {out_file}...")
     with open(out_file, 'w') as file:
-        print(pretty_print_timetable(best_state.timetable, INPUT_FILE), file=file)
+        State.renderer().write(best_state.timetable_dict(), file)
+        file.write('\n')
 
     if print_constraints:
         print(f"Soft constraints: {best_state.soft_wrapper()}")
@@ -72,15 +99,35 @@ def run_test(algorithm: callable, input_file: str, n_trials: int, print_constrai
 
 if __name__ == '__main__':
     # receive a string and an input file
-    if len(sys.argv) < 2 or len(sys.argv) > 4:
-        print("\t!!! Usage: python3 orar.py <algorithm> <input_file> [n_trials]")
-        sys.exit(1)
-
-    if len(sys.argv) == 4:
-        N_TRIALS = int(sys.argv[3])
-
-    ALGORITHM = sys.argv[1]
-    INPUT_FILE = sys.argv[2]
+    parser = argparse.ArgumentParser(usage="python3 orar.py <algorithm> <input_file> [n_trials] [--compact] [--no-cache] [--greedy] [--batch] [--operators] [--tabu-size N] [--workers N] [--budget N] [--rollouts K] [--t0 T] [--alpha A] [--tenure N] [--max-nodes N] [--jobs N] [--quiet] [--stats [FILE]]")
+    parser.add_argument('algorithm', help="hc [or hc_first or hc_classic], mcts, sa, tabu, exact")
+    parser.add_argument('input_file')
+    parser.add_argument('n_trials', nargs='?', type=int, default=N_TRIALS)
+    parser.add_argument('--compact', action='store_true', help="hold the timetable in a flat array instead of nested dicts")
+    parser.add_argument('--no-cache', action='store_true', help="always parse the input file instead of loading its compiled instance from .cache/")
+    parser.add_argument('--greedy', action='store_true', help="start from a greedy (most constrained subject first) timetable instead of the empty one")
+    parser.add_argument('--batch', action='store_true', help="hill climbing: score the whole neighbourhood at once with numpy")
+    parser.add_argument('--operators', action='store_true', help="hill climbing: try the relocate and swap moves when no other move is better")
+    parser.add_argument('--tabu-size', type=int, default=0, help="hc: number of visited states the restarts remember and skip")
+    parser.add_argument('--workers', type=int, default=1, help="hc: run the random restarts in parallel in N processes; mcts: build N trees in parallel for each decision (root parallel)")
+    parser.add_argument('--budget', type=int, default=None, help="mcts: number of iterations of each tree per decision (default 50)")
+    parser.add_argument('--rollouts', type=int, default=1, help="mcts: number of rollouts from each expanded leaf, run in parallel in a pool")
+    parser.add_argument('--t0', type=float, default=None, help="sa: starting temperature (default 2.0)")
+    parser.add_argument('--alpha', type=float, default=None, help="sa: cooling factor of the temperature after each iteration (default 0.995)")
+    parser.add_argument('--tenure', type=int, default=None, help="tabu: number of iterations a changed classroom stays tabu (default 10)")
+    parser.add_argument('--max-nodes', type=int, default=None, help="exact: stop the search after N nodes (the result is then not proven optimal)")
+    parser.add_argument('--jobs', type=int, default=1, help="run the trials in parallel in N processes")
+    parser.add_argument('--quiet', action='store_true', help="don't print the timetable of each trial (the best one is still written to outputs/)")
+    parser.add_argument('--stats', nargs='?', const='stats.json', default=None, metavar='FILE',
+                        help="count and time the hot paths of the search (moves, fitness, neighbours, mcts phases), print them and write them as JSON to FILE (default stats.json)")
+    args = parser.parse_args()
+
+    N_TRIALS = args.n_trials
+    ALGORITHM = args.algorithm
+    INPUT_FILE = args.input_file
+    State.COMPACT = args.compact
+    if args.no_cache:
+        State.CACHE_DIR = None
 
     # check if the algorithm_name is valid
     if ALGORITHM == 'hc':
@@ -91,17 +138,92 @@ if __name__ == '__main__':
         algorithm = hill_climbing
     elif ALGORITHM == 'mcts':
         algorithm = run_mcts
+    elif ALGORITHM == 'sa':
+        algorithm = simulated_annealing
+    elif ALGORITHM == 'tabu':
+        algorithm = tabu_search
+    elif ALGORITHM == 'exact':
+        algorithm = solve_exact
     else:
-        print("Invalid algorithm => Options are: hc [or hc_first or hc_classic], mcts")
+        print("Invalid algorithm => Options are: hc [or hc_first or hc_classic], mcts, sa, tabu, exact")
+        sys.exit(1)
+
+    # extra params of the algorithm
+    kwargs = {}
+    if args.batch:
+        if ALGORITHM not in ('hc', 'hc_first', 'hc_classic'):
+            print("--batch is only available for the hill climbing algorithms")
+            sys.exit(1)
+        kwargs['batch'] = True
+    if args.operators:
+        if ALGORITHM not in ('hc', 'hc_first', 'hc_classic'):
+            print("--operators is only available for the hill climbing algorithms (sa and tabu always use them)")
+            sys.exit(1)
+        kwargs['operators'] = True
+    if args.tabu_size > 0:
+        if ALGORITHM != 'hc':
+            print("--tabu-size is only available for the hc algorithm")
+            sys.exit(1)
+        kwargs['tabu_size'] = args.tabu_size
+    if args.workers > 1:
+        if ALGORITHM not in ('hc', 'mcts'):
+            print("--workers is only available for the hc and mcts algorithms")
+            sys.exit(1)
+        kwargs['workers'] = args.workers
+    if args.budget is not None:
+        if ALGORITHM != 'mcts':
+            print("--budget is only available for the mcts algorithm")
+            sys.exit(1)
+        kwargs['budget'] = args.budget
+    if args.rollouts > 1:
+        if ALGORITHM != 'mcts':
+            print("--rollouts is only available for the mcts algorithm")
+            sys.exit(1)
+        kwargs['rollouts'] = args.rollouts
+    for param, value in (('t0', args.t0), ('alpha', args.alpha)):
+        if value is not None:
+            if ALGORITHM != 'sa':
+                print(f"--{param} is only available for the sa algorithm")
+                sys.exit(1)
+            kwargs[param] = value
+    if args.tenure is not None:
+        if ALGORITHM != 'tabu':
+            print("--tenure is only available for the tabu algorithm")
+            sys.exit(1)
+        kwargs['tenure'] = args.tenure
+    if args.max_nodes is not None:
+        if ALGORITHM != 'exact':
+            print("--max-nodes is only available for the exact algorithm")
+            sys.exit(1)
+        kwargs['max_nodes'] = args.max_nodes
+    if args.greedy and ALGORITHM == 'exact':
+        print("--greedy can t be used with the exact algorithm (it keeps the classes of the initial timetable)")
+        sys.exit(1)
+    if args.tabu_size > 0 and args.workers > 1:
+        print("--tabu-size can t be used together with --workers (the parallel restarts can t share the table of visited states)")
+        sys.exit(1)
+    if args.jobs > 1 and (args.workers > 1 or args.rollouts > 1):
+        print("--jobs can t be used together with --workers or --rollouts (the trial processes can t start their own pools)")
+        sys.exit(1)
+    if args.stats is not None and (args.jobs > 1 or args.workers > 1 or args.rollouts > 1):
+        print("--stats can t be used together with --jobs, --workers or --rollouts (only the main process is instrumented)")
         sys.exit(1)
 
     # create outputs dir if it doesn't exist
     if not os.path.exists("outputs"):
         os.makedirs("outputs")
 
+    if args.stats is not None:
+        instrumentation.enable()
+
     # run the test and time it
     time_start = time()
-    run_test(algorithm, INPUT_FILE, n_trials=N_TRIALS)
+    run_test(algorithm, INPUT_FILE, n_trials=N_TRIALS, jobs=args.jobs, greedy=args.greedy, print_timetables=not args.quiet, **kwargs)
     time_end = time()
 
     print(f"\nExecution time: {(time_end - time_start):.2f} seconds")
+
+    if args.stats is not None:
+        stats = instrumentation.disable()
+        print(f"\nInstrumentation (written to {args.stats}):\n{stats}")
+        stats.dump(args.stats)
@@ -1,19 +1,56 @@
-from functools import reduce
 import math as m
 import random as r
+import hashlib, os, pickle, sys
 
-from copy import deepcopy
+from array import array
+from copy import copy
 
 from my_utils import *
 from utils import *
+from compact import CompactLayout, CompactTimetable, timetable_to_dict
 import random
 
+np = None # numpy is only needed for the batch scoring of the neighbourhood -> imported on first use (see import_numpy)
+
 HARD_QUOTIENTS = {
     'c_intervals': 200,
     'c_stud_left': 40,
     'c_mult': 150
 }
 SOFT_QUOTIENT = 1
+ENV_CACHE_VERSION = 1 # part of the key of the compiled instances, with the source of ENV_SOURCES (see env_source_hash)
+ENV_SOURCES = ('state', 'compact', 'my_utils', 'utils') # modules that build the environment
+RUNTIME_SETTINGS = ('INPUT_FILE', 'COMPACT', 'CACHE_DIR') # class level data that is not part of a compiled instance
+_env_source_hash = None
+
+
+def env_source_hash() -> str:
+    '''
+        Returns a hash of the source of the modules that build the environment (ENV_SOURCES)
+        -> any change of them compiles the instances again, instead of loading environments built by the old code
+    '''
+    global _env_source_hash
+    if _env_source_hash is None:
+        source = hashlib.sha256()
+        for module in ENV_SOURCES:
+            with open(sys.modules[module].__file__, 'rb') as file:
+                source.update(file.read())
+        _env_source_hash = source.hexdigest()
+    return _env_source_hash
+
+
+def import_numpy():
+    '''
+        Imports numpy on first use (it takes longer to import than the rest of the program) -> None if it is not installed
+    '''
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
 
 class State:
     '''
@@ -24,16 +61,38 @@ class State:
     PROF_SUBS = None
     CONSTRAINTS = None
     INPUT_FILE = None
+    COMPACT = False # if True, the timetable is held in a flat array (CompactTimetable) instead of nested dicts
+    CACHE_DIR = '.cache' # directory of the compiled instances (preprocessed environments), None -> always parse the input file
+    LAYOUT = None # integer indexing of days, intervals, classrooms, professors and subjects
 
     __specs = None # the specs of the timetable -> directly from the input file
     __min_capacity_of_classroom = None # the minimum capacity of a classroom
     __sorted_subjects = None # subjects sorted by number of classrooms where they can be taught
+    __max_pause_of_mask = None # longest pause for every set of intervals of a day (bitmask), None if less than 2 intervals
+    __room_index = None # {classroom: list(subject, professors for subject)} -> only the subjects that can be taught in the classroom
+    __soft_day_slots = None # {professor: bitset of the slots in a day the professor doesn't want to teach}
+    __soft_interval_slots = None # {professor: bitset of the slots in an interval the professor doesn't want to teach}
+    __soft_penalty = None # {professor: list(soft penalty of teaching in each slot)}
+    __batch = None # numpy arrays used by score_neighbourhood (built on its first call)
+    __renderer = None # TimetableRenderer of the instance (built on the first print)
+    __zobrist = None # random 64-bit key for every (cell, class code) -> Zobrist hash of the timetable
+    __num_codes = None # number of class codes of a cell (empty + every (professor, subject))
+    __cells = None # list of every (day, interval, classroom) of the timetable
+    __day_order = None # index buffers shuffled in place by get_random_action (days, intervals, classrooms)
+    __interval_order = None
+    __room_order = None
+    __room_subjects = None # flat list of the subjects (indices) of each classroom, most constrained first
+    __room_subject_start = None # the subjects of classroom c are __room_subjects[__room_subject_start[c]:__room_subject_start[c + 1]]
+    __prof_order = None # flat list of the professors (indices) of each subject, shuffled in place by get_random_action
+    __prof_start = None # the professors of subject s are __prof_order[__prof_start[s]:__prof_start[s + 1]]
+    __soft_day_bits = None # [professor index] -> __soft_day_slots
+    __soft_interval_bits = None # [professor index] -> __soft_interval_slots
 
 
     def __init__(
             self,
             timetable: dict = None, # timetable: {day: {interval: {classroom: (professor, subject)}}} -> the timetable of the state
-            profs: dict = None, # profs: {professor: list(day, interval)} -> intervals that the professor is already busy in a course
+            profs: dict = None, # profs: {professor: list(day, interval)} -> intervals that the professor is already busy in a course (kept as occupancy bitsets)
             students: dict = None, # students: {subject: int} -> number of students assigned to a subject at a certain time
             fitness: dict = None, # fitness: {c_intervals: int, c_stud_left: int, c_mult: int, c_soft: int, c_pause: int} -> the fitness of the state
             depth: int = 0 # depth of the state (only used for MCTS )
@@ -42,155 +101,393 @@ class State:
         if State.CLASSROOMS is None or State.SUBJECTS is None or State.CONSTRAINTS is None:
             if State.INPUT_FILE is None:
                 raise ValueError("Environment unknown. Please set the input file first.")
-            State.__set_env(State.INPUT_FILE, debug_flag=True)
+            State.__load_env(State.INPUT_FILE, debug_flag=True)
         
-        (self.timetable, self.profs) = (timetable, profs) if timetable is not None else State.__generate_timetable()
+        (self.timetable, profs) = (timetable, profs) if timetable is not None else State.__generate_timetable()
+        self.__build_prof_helpers(profs)
         self.students = students if students is not None else {subject: 0 for subject in State.SUBJECTS}
+        self.deficit = {subject: State.__stud_deficit(subject, self.students[subject]) for subject in self.students} # classrooms still needed per subject
+        self.covered = {subject for subject in self.deficit if self.deficit[subject] == 0} # subjects with no students left
+        self.zobrist = self.__compute_zobrist() # Zobrist hash of the timetable
         self.fitness = self.__compute_fitness() if fitness is None else fitness
         self.depth = depth
+        self.__undo_log = [] # moves applied in place: (day, interval, classroom, old class, fitness delta)
+        self.__owned = set() if not isinstance(self.timetable, CompactTimetable) else None # days and (day, interval) dicts not shared with other states
 
 
     def apply_move(self, day: str, interval: tuple, classroom: str, prof: str, subject: str, depth: int = 0):
         '''
-            Applies a move to the timetable
+            Applies a move to the timetable and returns the new state (the current state is not modified)
+        '''
+        new_state = self.clone()
+        new_state.push_move(day, interval, classroom, prof, subject)
+        new_state.commit()
+        new_state.depth = depth
+        return new_state
+
+
+    def move_delta(self, day: str, interval: tuple, classroom: str, prof: str, subject: str) -> dict:
+        '''
+            Returns the change of each fitness component if the move was applied, without modifying the state
+            Covers all the moves of apply_move: remove class, add class and change class
         '''
-        new_timetable = deepcopy(self.timetable)
-        new_profs = deepcopy(self.profs)
-        new_students = deepcopy(self.students)
-        new_fitness = deepcopy(self.fitness)
+        delta = {component: 0 for component in self.fitness}
 
-        # if move == remove old class
-        if prof is None and subject is None and self.timetable[day][interval][classroom] is not None:
-            old_prof, old_sub = self.timetable[day][interval][classroom]
+        old_class = self.timetable[day][interval][classroom]
+        new_class = State.__target_class(old_class, prof, subject)
+        if new_class == old_class:
+            return delta
 
-            new_timetable[day][interval][classroom] = None
-            new_profs[old_prof].remove((day, interval))
+        (old_prof, old_sub) = old_class if old_class is not None else (None, None)
+        cap = State.CLASSROOMS[classroom][CAPACITATE]
+        slot = State.LAYOUT.slot_idx[(day, interval)]
+        day_shift = slot - State.LAYOUT.interval_idx[interval]
 
-            if len(new_profs[old_prof]) >= 7:
-                new_fitness['c_intervals'] -= HARD_QUOTIENTS['c_intervals']
+        for p in {old_prof, prof}:
+            if p is None:
+                continue
+            # +1 if the professor gains the class, -1 if the professor loses it, 0 if only the subject changes
+            diff = (p == prof) - (p == old_prof)
+            if diff == 0:
+                continue
 
-            new_students[old_sub] -= State.CLASSROOMS[classroom][CAPACITATE]
-            if new_students[old_sub] < State.SUBJECTS[old_sub][NUM_STUDENTS]:
-                new_fitness['c_stud_left'] = State.__compute_c_stud_left(new_students)
+            # professor teaching more than 7 classes
+            num_classes = self.prof_load[p]
+            delta['c_intervals'] += (max(0, num_classes + diff - 7) - max(0, num_classes - 7)) * HARD_QUOTIENTS['c_intervals']
 
-            # if prof is in multiple places at the same time
-            old_num_apps = reduce(lambda acc, x: acc + 1 if x == (day, interval) else acc, self.profs[old_prof], 0)
-            if old_num_apps > 1:
-                new_fitness['c_mult'] -= HARD_QUOTIENTS['c_mult']
+            # professor in multiple places at the same time
+            num_apps = self.slot_count[State.LAYOUT.prof_idx[p] * State.LAYOUT.num_slots + slot]
+            delta['c_mult'] += (max(0, num_apps + diff - 1) - max(0, num_apps - 1)) * HARD_QUOTIENTS['c_mult']
 
-            # update soft constraints
-            if day in State.CONSTRAINTS[old_prof][DAY_CONSTRAINTS]:
-                new_fitness['c_soft'] -= SOFT_QUOTIENT
-            if interval in State.CONSTRAINTS[old_prof][INT_CONSTRAINTS]:
-                new_fitness['c_soft'] -= SOFT_QUOTIENT
+            # soft constraints
+            delta['c_soft'] += diff * State.__soft_penalty[p][slot]
 
-            # update the pause constraint
-            new_fitness['c_pause'] = State.__compute_c_pause(new_timetable, new_profs)
+            # pause constraint -> only the day of the move changes
+            if State.CONSTRAINTS[p][PAUSE] is not None:
+                mask = (self.prof_busy[p] >> day_shift) & State.LAYOUT.day_mask
+                bit = 1 << State.LAYOUT.interval_idx[interval]
+                if diff > 0:
+                    new_mask = mask | bit
+                else:
+                    new_mask = mask & ~bit if num_apps == 1 else mask
+                delta['c_pause'] += State.__pause_penalty(p, new_mask) - State.__pause_penalty(p, mask)
 
-        # if move == add new class (before the class was None) -> written by copilot (could be wrong)
-        elif prof is not None and subject is not None and self.timetable[day][interval][classroom] is None:
-            new_timetable[day][interval][classroom] = (prof, subject)
-            new_profs[prof].append((day, interval))
+        for s in {old_sub, subject}:
+            if s is None:
+                continue
+            diff = (s == subject) - (s == old_sub)
+            if diff == 0:
+                continue
+            new_deficit = State.__stud_deficit(s, self.students[s] + diff * cap)
+            delta['c_stud_left'] += (new_deficit - self.deficit[s]) * HARD_QUOTIENTS['c_stud_left']
 
-            if len(new_profs[prof]) > 7:
-                new_fitness['c_intervals'] += HARD_QUOTIENTS['c_intervals']
+        return delta
 
-            new_students[subject] += State.CLASSROOMS[classroom][CAPACITATE]
-            new_fitness['c_stud_left'] = State.__compute_c_stud_left(new_students)
 
-            # if prof is in multiple places at the same time
-            old_num_apps = reduce(lambda acc, x: acc + 1 if x == (day, interval) else acc, self.profs[prof], 0)
-            if old_num_apps > 0:
-                new_fitness['c_mult'] += HARD_QUOTIENTS['c_mult']
-            
-            # update soft constraints
-            if day in State.CONSTRAINTS[prof][DAY_CONSTRAINTS]:
-                new_fitness['c_soft'] += SOFT_QUOTIENT
-            if interval in State.CONSTRAINTS[prof][INT_CONSTRAINTS]:
-                new_fitness['c_soft'] += SOFT_QUOTIENT
-
-            # update the pause constraint
-            new_fitness['c_pause'] = State.__compute_c_pause(new_timetable, new_profs)
-
-        # if move == change class -> remove class and add new class
-        elif prof is not None and subject is not None and self.timetable[day][interval][classroom] is not None:
-            _tmp_state = self.apply_move(day, interval, classroom, prof=None, subject=None)
-            return _tmp_state.apply_move(day, interval, classroom, prof=prof, subject=subject, depth=depth)
-        
-        return State(new_timetable, new_profs, new_students, new_fitness, depth= depth)
+    def push_move(self, day: str, interval: tuple, classroom: str, prof: str, subject: str):
+        '''
+            Applies a move in place and records it in the undo log
+            The move can be reverted with pop_move (moves are reverted in LIFO order)
+        '''
+        old_class = self.timetable[day][interval][classroom]
+        delta = self.move_delta(day, interval, classroom, prof, subject)
+        self.__undo_log.append((day, interval, classroom, old_class, delta))
+
+        self.__set_class(day, interval, classroom, State.__target_class(old_class, prof, subject))
+        for component, value in delta.items():
+            self.fitness[component] += value
+
+
+    def pop_move(self):
+        '''
+            Reverts the last move applied with push_move
+        '''
+        day, interval, classroom, old_class, delta = self.__undo_log.pop()
+        self.__set_class(day, interval, classroom, old_class)
+        for component, value in delta.items():
+            self.fitness[component] -= value
+
+
+    def commit(self):
+        '''
+            Makes the moves applied with push_move permanent (clears the undo log)
+        '''
+        self.__undo_log.clear()
+
+
+    @staticmethod
+    def __target_class(old_class: tuple, prof: str, subject: str) -> tuple:
+        '''
+            Returns the class of the classroom after a move (None if the move removes the class)
+        '''
+        if prof is None and subject is None:
+            return None
+        if prof is not None and subject is not None:
+            return (prof, subject)
+        return old_class
+
+
+    def moves_delta(self, moves: tuple) -> dict:
+        '''
+            Returns the change of each fitness component if the moves were applied one after the other, without modifying the state
+            The moves before the last one are pushed and popped -> every step is incremental
+        '''
+        fitness = dict(self.fitness)
+        for move in moves[:-1]:
+            self.push_move(*move)
+
+        delta = self.move_delta(*moves[-1])
+        for component in delta:
+            delta[component] += self.fitness[component] - fitness[component]
+
+        for _ in moves[:-1]:
+            self.pop_move()
+        return delta
+
+
+    def push_moves(self, moves: tuple):
+        '''
+            Applies the moves one after the other with push_move (each of them can be reverted with pop_move)
+        '''
+        for move in moves:
+            self.push_move(*move)
+
+
+    def move_hash(self, day: str, interval: tuple, classroom: str, prof: str, subject: str) -> int:
+        '''
+            Returns the Zobrist hash of the state obtained by applying the move, without applying it
+        '''
+        old_class = self.timetable[day][interval][classroom]
+        new_class = State.__target_class(old_class, prof, subject)
+        key_base = State.LAYOUT.cell(day, interval, classroom) * State.__num_codes
+        return self.zobrist ^ State.__zobrist[key_base + State.LAYOUT.encode(old_class)] ^ State.__zobrist[key_base + State.LAYOUT.encode(new_class)]
+
+
+    def moves_hash(self, moves: tuple) -> int:
+        '''
+            Returns the Zobrist hash of the state obtained by applying the moves one after the other, without applying them
+        '''
+        for move in moves[:-1]:
+            self.push_move(*move)
+        state_hash = self.move_hash(*moves[-1])
+        for _ in moves[:-1]:
+            self.pop_move()
+        return state_hash
+
+
+    def __set_class(self, day: str, interval: tuple, classroom: str, new_class: tuple):
+        '''
+            Sets the class of a classroom and updates the helpers (professor occupancy, students, deficit), without touching the fitness
+        '''
+        old_class = self.timetable[day][interval][classroom]
+        if old_class == new_class:
+            return
+
+        slot = State.LAYOUT.slot_idx[(day, interval)]
+        bit = 1 << slot
+
+        if old_class is not None:
+            old_prof, old_sub = old_class
+            idx = State.LAYOUT.prof_idx[old_prof] * State.LAYOUT.num_slots + slot
+            self.slot_count[idx] -= 1
+            self.prof_load[old_prof] -= 1
+            if self.slot_count[idx] == 0:
+                self.prof_busy[old_prof] &= ~bit
+            self.students[old_sub] -= State.CLASSROOMS[classroom][CAPACITATE]
+            self.__update_deficit(old_sub)
+
+        if new_class is not None:
+            prof, subject = new_class
+            idx = State.LAYOUT.prof_idx[prof] * State.LAYOUT.num_slots + slot
+            self.slot_count[idx] += 1
+            self.prof_load[prof] += 1
+            self.prof_busy[prof] |= bit
+            self.students[subject] += State.CLASSROOMS[classroom][CAPACITATE]
+            self.__update_deficit(subject)
+
+        key_base = State.LAYOUT.cell(day, interval, classroom) * State.__num_codes
+        self.zobrist ^= State.__zobrist[key_base + State.LAYOUT.encode(old_class)] ^ State.__zobrist[key_base + State.LAYOUT.encode(new_class)]
+
+        # copy on write -> the day and the interval may be shared with the parent / children of the state
+        if self.__owned is not None and (day, interval) not in self.__owned:
+            if day not in self.__owned:
+                self.timetable[day] = dict(self.timetable[day])
+                self.__owned.add(day)
+            self.timetable[day][interval] = dict(self.timetable[day][interval])
+            self.__owned.add((day, interval))
+
+        self.timetable[day][interval][classroom] = new_class
+
+
+    def __update_deficit(self, subject: str):
+        '''
+            Updates the deficit of a subject (and the set of covered subjects) after its students changed
+        '''
+        self.deficit[subject] = State.__stud_deficit(subject, self.students[subject])
+        if self.deficit[subject] == 0:
+            self.covered.add(subject)
+        else:
+            self.covered.discard(subject)
     
 
     def get_next_states_hc(self):
         '''
             Lazily generates the next states of the current state (add/remove moves)
         '''
+        for move in self.get_next_moves_hc():
+            yield self.apply_move(*move)
+
+
+    def get_next_moves_hc(self):
+        '''
+            Lazily generates the moves (day, interval, classroom, prof, subject) that lead to the next states
+            The state may be modified with push_move between two moves, as long as it is restored with pop_move
+        '''
         for day in shuffle_dict(self.timetable).keys():
             for interval in shuffle_dict(self.timetable[day]).keys():
+                slot_bit = 1 << State.LAYOUT.slot_idx[(day, interval)]
                 for classroom in shuffle_dict(self.timetable[day][interval]).keys():
 
                     # if a class is already assigned to the classroom -> skip with a probability of 0.5
                     if self.timetable[day][interval][classroom] is not None and r.random() < 0.5:
                         continue
 
-                    for subject in State.__sorted_subjects:
+                    # only the subjects that can be taught in the classroom
+                    for subject, sorted_profs in State.__room_index[classroom]:
                         # don t add a class if there are no students left for that subject
-                        if self.students[subject] >= State.SUBJECTS[subject][NUM_STUDENTS]:
-                            continue
-
-                        # if the classroom is not for this subject -> skip
-                        if subject not in State.CLASSROOMS[classroom][MATERII]:
+                        if subject in self.covered:
                             continue
 
-                        sorted_profs = State.SUBJECTS[subject][PROF_FOR_SUBJECT]
                         random.shuffle(sorted_profs)
                         for prof in sorted_profs:
                             # if the professor is already busy in that interval -> skip
-                            if (day, interval) in self.profs[prof]:
+                            if self.prof_busy[prof] & slot_bit:
                                 continue
 
                             # duplicate class -> skip
                             if self.timetable[day][interval][classroom] == (prof, subject):
                                 continue
 
-                            next_state = self.apply_move(day, interval, classroom, prof=prof, subject=subject)
-                            yield next_state
+                            yield (day, interval, classroom, prof, subject)
+
+
+    def get_relocate_moves(self):
+        '''
+            Lazily generates the relocate moves: a class goes to an empty classroom (that can host its subject) in another slot or room
+            Each move is a tuple of moves (see moves_delta): empty the classroom of the class, then place the class in the new one
+        '''
+        occupied = [cell for cell in State.__cells if self.timetable[cell[0]][cell[1]][cell[2]] is not None]
+        random.shuffle(occupied)
+
+        for src in occupied:
+            prof, subject = self.timetable[src[0]][src[1]][src[2]]
+            src_slot = State.LAYOUT.slot_idx[src[:2]]
+
+            for dst in random.sample(State.__cells, len(State.__cells)):
+                day, interval, classroom = dst
+                if self.timetable[day][interval][classroom] is not None or subject not in State.CLASSROOMS[classroom][MATERII]:
+                    continue
+
+                # the professor must be free in the new slot
+                slot = State.LAYOUT.slot_idx[(day, interval)]
+                if slot != src_slot and self.prof_busy[prof] & (1 << slot):
+                    continue
+
+                yield ((*src, None, None), (day, interval, classroom, prof, subject))
+
+
+    def get_swap_moves(self):
+        '''
+            Lazily generates the swap moves of two classes of the timetable:
+                - the classes exchange their classrooms (if each classroom can host the other subject)
+                - the classes exchange their professors (if each professor teaches the other subject)
+            Each move is a tuple of moves (see moves_delta)
+            A swap is symmetric -> each pair of classes is generated once, in the (random) order of a single shuffle
+        '''
+        occupied = [cell for cell in State.__cells if self.timetable[cell[0]][cell[1]][cell[2]] is not None]
+        random.shuffle(occupied)
+
+        for i, a in enumerate(occupied):
+            prof_a, sub_a = self.timetable[a[0]][a[1]][a[2]]
+            slot_a = State.LAYOUT.slot_idx[a[:2]]
+
+            for b in occupied[i + 1:]:
+                prof_b, sub_b = self.timetable[b[0]][b[1]][b[2]]
+                if (prof_a, sub_a) == (prof_b, sub_b):
+                    continue
+
+                # each professor must be free in the slot of the other class
+                slot_b = State.LAYOUT.slot_idx[b[:2]]
+                if slot_a != slot_b and prof_a != prof_b and (self.prof_busy[prof_a] & (1 << slot_b) or self.prof_busy[prof_b] & (1 << slot_a)):
+                    continue
+
+                if sub_b in State.CLASSROOMS[a[2]][MATERII] and sub_a in State.CLASSROOMS[b[2]][MATERII]:
+                    yield ((*a, prof_b, sub_b), (*b, prof_a, sub_a))
+
+                # same subject -> exchanging the professors is the same as exchanging the classes
+                if prof_a != prof_b and sub_a != sub_b and sub_a in State.PROF_SUBS[prof_b] and sub_b in State.PROF_SUBS[prof_a]:
+                    yield ((*a, prof_b, sub_a), (*b, prof_a, sub_b))
 
 
     def get_random_action(self):
         '''
             Generate a random action for the current state => used in mcts simulation
+            Walks the days, intervals and classrooms in random order and returns the first feasible (professor, subject):
+            an occupied classroom is skipped with a probability of 0.5, a professor who doesn t want the interval with 0.9
+            The random orders are drawn lazily (Fisher-Yates) in the preallocated index buffers of __set_env -> no lists or
+            dicts are built per call, and the professor lists of the environment are not shuffled
         '''
-        for day in shuffle_dict(self.timetable).keys():
-            for interval in shuffle_dict(self.timetable[day]).keys():
-                for classroom in shuffle_dict(self.timetable[day][interval]).keys():
-                    if self.timetable[day][interval][classroom] is not None and r.random() < 0.5:
+        layout = State.LAYOUT
+        rand = r.random
+        days, intervals, rooms, profs = State.__day_order, State.__interval_order, State.__room_order, State.__prof_order
+        num_days, num_intervals, num_rooms = len(days), len(intervals), len(rooms)
+
+        for d in range(num_days):
+            j = d + int(rand() * (num_days - d))
+            days[d], days[j] = days[j], days[d]
+            day = layout.days[days[d]]
+            day_timetable = self.timetable[day]
+
+            for i in range(num_intervals):
+                j = i + int(rand() * (num_intervals - i))
+                intervals[i], intervals[j] = intervals[j], intervals[i]
+                interval = layout.intervals[intervals[i]]
+                interval_timetable = day_timetable[interval]
+                slot_bit = 1 << (days[d] * num_intervals + intervals[i])
+
+                for c in range(num_rooms):
+                    j = c + int(rand() * (num_rooms - c))
+                    rooms[c], rooms[j] = rooms[j], rooms[c]
+                    classroom = layout.rooms[rooms[c]]
+                    if interval_timetable[classroom] is not None and rand() < 0.5:
                         continue
 
-                    for subject in State.__sorted_subjects:
-                        # if the classroom is not for this subject -> skip
-                        if subject not in State.CLASSROOMS[classroom][MATERII]:
-                            continue
-
+                    # only the subjects that can be taught in the classroom
+                    for k in range(State.__room_subject_start[rooms[c]], State.__room_subject_start[rooms[c] + 1]):
+                        sub = State.__room_subjects[k]
+                        subject = layout.subjects[sub]
                         # don t add a class if there are no students left for that subject
-                        if self.students[subject] >= State.SUBJECTS[subject][NUM_STUDENTS]:
+                        if subject in self.covered:
                             continue
 
-                        profs = State.SUBJECTS[subject][PROF_FOR_SUBJECT]
-                        random.shuffle(profs)
-                        for prof in profs:
-                            if day in State.CONSTRAINTS[prof][DAY_CONSTRAINTS] or interval in State.CONSTRAINTS[prof][INT_CONSTRAINTS] and r.random() < 0.9:
+                        start, end = State.__prof_start[sub], State.__prof_start[sub + 1]
+                        for q in range(start, end):
+                            j = q + int(rand() * (end - q))
+                            profs[q], profs[j] = profs[j], profs[q]
+                            p = profs[q]
+                            if State.__soft_day_bits[p] & slot_bit or State.__soft_interval_bits[p] & slot_bit and rand() < 0.9:
                                 continue
 
                             # if the professor is already busy in that interval -> skip
-                            if (day, interval) in self.profs[prof]:
+                            prof = layout.profs[p]
+                            if self.prof_busy[prof] & slot_bit:
                                 continue
 
                             # if prof already has 7 classes -> skip
-                            if len(self.profs[prof]) >= 7:
+                            if self.prof_load[prof] >= 7:
                                 continue
 
-                            action = (day, interval, classroom, prof, subject)
-                            return action
+                            return (day, interval, classroom, prof, subject)
         return None
 
 
@@ -202,32 +499,29 @@ class State:
         break_c_actions = 0
         for day in self.timetable.keys():
             for interval in self.timetable[day].keys():
+                slot_bit = 1 << State.LAYOUT.slot_idx[(day, interval)]
                 for classroom in self.timetable[day][interval].keys():
                     if self.timetable[day][interval][classroom] is not None:
                         continue
 
-                    for subject in State.__sorted_subjects:
-                        # if the classroom is not for this subject -> skip
-                        if subject not in State.CLASSROOMS[classroom][MATERII]:
-                            continue
-
+                    # only the subjects that can be taught in the classroom
+                    for subject, profs in State.__room_index[classroom]:
                         # don t add a class if there are no students left for that subject
-                        if self.students[subject] >= State.SUBJECTS[subject][NUM_STUDENTS] and self.timetable[day][interval][classroom] is None:
+                        if subject in self.covered:
                             continue
 
-                        profs = State.SUBJECTS[subject][PROF_FOR_SUBJECT]
                         for prof in profs:
-                            if day in State.CONSTRAINTS[prof][DAY_CONSTRAINTS] or interval in State.CONSTRAINTS[prof][INT_CONSTRAINTS] and break_c_actions >= 3:
+                            if State.__soft_day_slots[prof] & slot_bit or State.__soft_interval_slots[prof] & slot_bit and break_c_actions >= 3:
                                 continue
                             else:
                                 break_c_actions += 1
 
                             # if the professor is already busy in that interval -> skip
-                            if (day, interval) in self.profs[prof]:
+                            if self.prof_busy[prof] & slot_bit:
                                 continue
 
                             # if prof already has 7 classes -> skip
-                            if len(self.profs[prof]) >= 7:
+                            if self.prof_load[prof] >= 7:
                                 continue
 
                             action = (day, interval, classroom, prof, subject)
@@ -235,16 +529,112 @@ class State:
         return actions
 
 
+    def score_neighbourhood(self):
+        '''
+            Scores all the "place (prof, subject) in this classroom" moves of the state at once (requires numpy)
+            Same moves as get_next_moves_hc, without the random skipping of occupied classrooms
+            Returns (candidates, deltas): the candidate ids (decode them with candidate_move) and the total fitness delta of each
+        '''
+        if State.__batch is None:
+            if import_numpy() is None:
+                raise ImportError("numpy is required for the batch scoring of the neighbourhood")
+            State.__batch = State.__build_batch_index()
+
+        b = State.__batch
+        layout = State.LAYOUT
+        num_profs, num_days = len(layout.profs), len(layout.days)
+
+        counts = np.frombuffer(self.slot_count, dtype=np.uint16).reshape(num_profs, layout.num_slots).astype(np.int64)
+        load = np.array([self.prof_load[prof] for prof in layout.profs])
+        students = np.array([self.students[subject] for subject in layout.subjects])
+        deficit = np.array([self.deficit[subject] for subject in layout.subjects])
+
+        # bitmask of the intervals taught by each professor in each day
+        day_masks = ((counts.reshape(num_profs, num_days, layout.num_intervals) > 0) << np.arange(layout.num_intervals)).sum(axis=2)
+
+        def pause_penalty(profs, masks):
+            return np.maximum(b['max_pause'][masks] - b['pause'][profs], 0) * SOFT_QUOTIENT
+
+        def stud_deficit(subjects, no_students):
+            return np.maximum(0, -((no_students - b['num_students'][subjects]) // State.__min_capacity_of_classroom))
+
+        # the class that is removed from each cell (if any)
+        codes = self.__cell_codes()
+        occupied = codes > 0
+        old_prof = np.where(occupied, (codes - 1) // layout.num_subjects, 0)
+        old_sub = np.where(occupied, (codes - 1) % layout.num_subjects, -1)
+        old_apps = counts[old_prof, b['cell_slot']]
+        old_mask = day_masks[old_prof, b['cell_day']]
+        new_mask = np.where(old_apps == 1, old_mask & ~b['cell_bit'], old_mask)
+        cell_delta = (
+            np.where(load[old_prof] >= 8, -HARD_QUOTIENTS['c_intervals'], 0)
+            + np.where(old_apps >= 2, -HARD_QUOTIENTS['c_mult'], 0)
+            - b['soft'][old_prof, b['cell_slot']]
+            + pause_penalty(old_prof, new_mask) - pause_penalty(old_prof, old_mask)
+        )
+        cell_delta = np.where(occupied, cell_delta, 0)
+        cell_stud = np.where(occupied, stud_deficit(old_sub, students[old_sub] - b['cell_cap']) - deficit[old_sub], 0)
+
+        # the class that is added by each candidate -> the professor is never busy in that slot
+        prof, subject, cell = b['prof'], b['subject'], b['cell']
+        valid = (counts[prof, b['slot']] == 0) & (deficit[subject] > 0)
+
+        mask = day_masks[prof, b['day']]
+        stud = stud_deficit(subject, students[subject] + b['cap']) - deficit[subject] + cell_stud[cell]
+        stud = np.where(old_sub[cell] == subject, 0, stud) # same subject -> the students don t change
+        deltas = (
+            np.where(load[prof] >= 7, HARD_QUOTIENTS['c_intervals'], 0)
+            + b['soft'][prof, b['slot']]
+            + pause_penalty(prof, mask | b['bit']) - pause_penalty(prof, mask)
+            + stud * HARD_QUOTIENTS['c_stud_left']
+            + cell_delta[cell]
+        )
+
+        candidates = valid.nonzero()[0]
+        return candidates, deltas[candidates]
+
+
+    @staticmethod
+    def candidate_move(candidate: int) -> tuple:
+        '''
+            Returns the move (day, interval, classroom, prof, subject) of a candidate of score_neighbourhood
+        '''
+        layout = State.LAYOUT
+        b = State.__batch
+        day_idx, interval_idx = divmod(int(b['slot'][candidate]), layout.num_intervals)
+        return (
+            layout.days[day_idx],
+            layout.intervals[interval_idx],
+            layout.rooms[int(b['cell'][candidate]) % layout.num_rooms],
+            layout.profs[int(b['prof'][candidate])],
+            layout.subjects[int(b['subject'][candidate])]
+        )
+
+
+    def __cell_codes(self):
+        '''
+            Returns the codes of the classes of all the cells, in the order of the CompactTimetable grid
+        '''
+        if isinstance(self.timetable, CompactTimetable):
+            return np.array(self.timetable.grid, dtype=np.int64)
+
+        layout = State.LAYOUT
+        return np.array([layout.encode(self.timetable[day][interval][classroom])
+                         for day in layout.days for interval in layout.intervals for classroom in layout.rooms], dtype=np.int64)
+
+
     def __compute_fitness(self):
         '''
             Returns the fitness of the current state
         '''
+        profs = self.profs
+
         _fitness = {}
-        _fitness['c_intervals'] = State.__compute_c_intervals(self.profs)
+        _fitness['c_intervals'] = State.__compute_c_intervals(profs)
         _fitness['c_stud_left'] = State.__compute_c_stud_left(self.students)
         _fitness['c_mult'] = State.__compute_c_mult(self.timetable)
-        _fitness['c_soft'] = State.__compute_c_soft(self.profs)
-        _fitness['c_pause'] = State.__compute_c_pause(self.timetable, self.profs)
+        _fitness['c_soft'] = State.__compute_c_soft(profs)
+        _fitness['c_pause'] = State.__compute_c_pause(self.timetable, profs)
 
         return _fitness
 
@@ -268,11 +658,18 @@ class State:
         '''
         c_stud_left = 0
         for subject, no_students in students.items():
-            dif = State.SUBJECTS[subject][NUM_STUDENTS] - no_students
-            dif = max(0, m.ceil(dif / State.__min_capacity_of_classroom))
-            c_stud_left += dif * HARD_QUOTIENTS['c_stud_left']
+            c_stud_left += State.__stud_deficit(subject, no_students) * HARD_QUOTIENTS['c_stud_left']
 
         return c_stud_left
+
+
+    @staticmethod
+    def __stud_deficit(subject: str, no_students: int) -> int:
+        '''
+            Computes the deficit of one subject (number of classrooms of minimum capacity still needed)
+        '''
+        dif = State.SUBJECTS[subject][NUM_STUDENTS] - no_students
+        return max(0, m.ceil(dif / State.__min_capacity_of_classroom))
     
 
     @staticmethod
@@ -298,8 +695,9 @@ class State:
             Wrapper for the soft constraints
         '''
         print('*' * 50 + "SOFT CONSTRAINTS" + '*' * 50)
-        return (State.__compute_c_soft(self.profs, debug_flag=True)
-                + State.__compute_c_pause(self.timetable, self.profs, debug_flag=True))
+        profs = self.profs
+        return (State.__compute_c_soft(profs, debug_flag=True)
+                + State.__compute_c_pause(self.timetable, profs, debug_flag=True))
 
 
     @staticmethod
@@ -360,13 +758,7 @@ class State:
                 if len(prof_classes) < 2:
                     continue
 
-                max_pause = 0
-                prof_classes.sort(key=lambda x: x[1])
-                for i in range(1, len(prof_classes)):
-                    cur_pause = prof_classes[i][1] - prof_classes[i - 1][1]
-                    max_pause = max(max_pause, cur_pause)
-
-                max_pause -= 2
+                max_pause = State.__max_pause(prof_classes)
                 if max_pause > State.CONSTRAINTS[prof][PAUSE]:
                     all_good_debug = False
                     if debug_flag:
@@ -380,6 +772,88 @@ class State:
         return c_pause
 
 
+    @staticmethod
+    def __max_pause(prof_classes: list) -> int:
+        '''
+            Returns the longest pause (in hours) between two consecutive classes of a professor in a day
+        '''
+        max_pause = 0
+        prof_classes = sorted(prof_classes, key=lambda x: x[1])
+        for i in range(1, len(prof_classes)):
+            cur_pause = prof_classes[i][1] - prof_classes[i - 1][1]
+            max_pause = max(max_pause, cur_pause)
+
+        return max_pause - 2
+
+
+    @staticmethod
+    def __pause_penalty(prof: str, mask: int) -> int:
+        '''
+            Computes the c_pause penalty of a professor for the intervals (bitmask) taught in one day
+        '''
+        max_pause = State.__max_pause_of_mask[mask]
+        if max_pause is None:
+            return 0
+        return max(max_pause - State.CONSTRAINTS[prof][PAUSE], 0) * SOFT_QUOTIENT
+
+
+    def __build_prof_helpers(self, profs: dict):
+        '''
+            Builds the professor occupancy helpers from {professor: list(day, interval)}
+                slot_count: number of classes of each professor in each slot (flat array, indexed by prof * num_slots + slot)
+                prof_busy: {professor: bitset of the slots where the professor teaches}
+                prof_load: {professor: number of classes the professor teaches}
+        '''
+        self.slot_count = array('H', [0]) * (len(State.LAYOUT.profs) * State.LAYOUT.num_slots)
+        self.prof_busy = {prof: 0 for prof in State.LAYOUT.profs}
+        self.prof_load = {prof: 0 for prof in State.LAYOUT.profs}
+        for prof in profs:
+            for day, interval in profs[prof]:
+                slot = State.LAYOUT.slot_idx[(day, interval)]
+                self.slot_count[State.LAYOUT.prof_idx[prof] * State.LAYOUT.num_slots + slot] += 1
+                self.prof_busy[prof] |= 1 << slot
+                self.prof_load[prof] += 1
+
+
+    @property
+    def profs(self) -> dict:
+        '''
+            Returns {professor: list(day, interval)} -> intervals that the professor is already busy in a course
+        '''
+        profs = {}
+        for p, prof in enumerate(State.LAYOUT.profs):
+            base = p * State.LAYOUT.num_slots
+            profs[prof] = [(day, interval) for (day, interval), slot in State.LAYOUT.slot_idx.items()
+                           for _ in range(self.slot_count[base + slot])]
+        return profs
+
+
+    def __compute_zobrist(self) -> int:
+        '''
+            Computes the Zobrist hash of the timetable from scratch
+        '''
+        zobrist = 0
+        for day in self.timetable:
+            for interval in self.timetable[day]:
+                for classroom in self.timetable[day][interval]:
+                    code = State.LAYOUT.encode(self.timetable[day][interval][classroom])
+                    zobrist ^= State.__zobrist[State.LAYOUT.cell(day, interval, classroom) * State.__num_codes + code]
+        return zobrist
+
+
+    def __hash__(self) -> int:
+        return self.zobrist
+
+
+    def __eq__(self, other) -> bool:
+        '''
+            Two states are equal if they have the same timetable (the hashes are compared first)
+        '''
+        if not isinstance(other, State):
+            return NotImplemented
+        return self.zobrist == other.zobrist and self.timetable_dict() == other.timetable_dict()
+
+
     def is_final(self) -> bool:
         '''
             Returns True if the state is final
@@ -433,6 +907,85 @@ class State:
         return round(bfactor)
 
 
+    @staticmethod
+    def export_env() -> dict:
+        '''
+            Returns the environment of the search space (all the class level data, loaded from State.INPUT_FILE if needed)
+            -> can be shipped to other processes and restored there with import_env
+        '''
+        if State.CLASSROOMS is None or State.SUBJECTS is None or State.CONSTRAINTS is None:
+            if State.INPUT_FILE is None:
+                raise ValueError("Environment unknown. Please set the input file first.")
+            State.__load_env(State.INPUT_FILE)
+
+        return {name: getattr(State, name) for name in State.__env_names()}
+
+
+    @staticmethod
+    def __env_names() -> list:
+        '''
+            Returns the names of the class level data of State (the environment)
+        '''
+        return [name for name, value in vars(State).items()
+                if not name.startswith('__') and not isinstance(value, (staticmethod, classmethod, property)) and not callable(value)]
+
+
+    @staticmethod
+    def import_env(env: dict):
+        '''
+            Restores an environment returned by export_env
+        '''
+        for name, value in env.items():
+            setattr(State, name, value)
+
+
+    @staticmethod
+    def __load_env(input_file: str, debug_flag: bool = False):
+        '''
+            Sets the environment for the search space from the compiled instance of the input file (State.CACHE_DIR),
+            or builds it with __set_env and compiles it
+            The compiled instances are keyed by a hash of the content of the input file -> a changed input file is compiled again
+        '''
+        if State.CACHE_DIR is None:
+            State.__set_env(input_file, debug_flag)
+            return
+
+        with open(input_file, 'rb') as file:
+            key = hashlib.sha256(file.read())
+        key.update(repr((ENV_CACHE_VERSION, env_source_hash(), SOFT_QUOTIENT, sys.version_info[:2])).encode())
+        name = os.path.basename(input_file).split('.')[0]
+        path = os.path.join(State.CACHE_DIR, f"{name}-{key.hexdigest()[:16]}.pickle")
+
+        try:
+            with open(path, 'rb') as file:
+                env = pickle.load(file)
+
+            # an environment with other data than the current State holds is stale -> build it again
+            expected = {name for name in State.__env_names() if name not in RUNTIME_SETTINGS}
+            if not isinstance(env, dict) or set(env) != expected:
+                raise pickle.UnpicklingError(f"stale compiled instance {path}")
+
+            State.import_env(env)
+            if debug_flag:
+                State.__print_env()
+            return
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass # no compiled instance (or an unreadable or stale one) -> build it
+
+        State.__set_env(input_file, debug_flag)
+
+        # the runtime settings are not part of the instance
+        env = {name: value for name, value in State.export_env().items() if name not in RUNTIME_SETTINGS}
+        try:
+            os.makedirs(State.CACHE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(env, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path) # atomic -> parallel runs never read a partial file
+        except OSError:
+            pass # the cache is only an optimization
+
+
     @staticmethod
     def __set_env(input_file: str, debug_flag: bool = False):
         '''
@@ -448,14 +1001,124 @@ class State:
         State.__specs = timetable_specs
         State.__min_capacity_of_classroom = min(State.CLASSROOMS.values(), key=lambda x: x[CAPACITATE])[CAPACITATE]
         State.__sorted_subjects = sorted(State.SUBJECTS.keys(), key=lambda x: len(State.SUBJECTS[x][CLASS_FOR_SUBJECT]))
+        State.LAYOUT = CompactLayout(
+            timetable_specs[ZILE],
+            [eval(interval) for interval in timetable_specs[INTERVALE]],
+            timetable_specs[SALI].keys(),
+            State.CONSTRAINTS.keys(),
+            State.SUBJECTS.keys()
+        )
+
+        State.__cells = [(day, interval, classroom) for day in State.LAYOUT.days for interval in State.LAYOUT.intervals for classroom in State.LAYOUT.rooms]
+
+        # static compatibility index -> classroom -> subjects (most constrained first) -> professors
+        State.__room_index = {
+            classroom: [(subject, State.SUBJECTS[subject][PROF_FOR_SUBJECT]) for subject in State.__sorted_subjects if subject in State.CLASSROOMS[classroom][MATERII]]
+            for classroom in State.CLASSROOMS
+        }
+
+        # soft constraints of each professor for each slot
+        State.__soft_day_slots = {prof: 0 for prof in State.CONSTRAINTS}
+        State.__soft_interval_slots = {prof: 0 for prof in State.CONSTRAINTS}
+        State.__soft_penalty = {prof: [0] * State.LAYOUT.num_slots for prof in State.CONSTRAINTS}
+        for prof in State.CONSTRAINTS:
+            for (day, interval), slot in State.LAYOUT.slot_idx.items():
+                if day in State.CONSTRAINTS[prof][DAY_CONSTRAINTS]:
+                    State.__soft_day_slots[prof] |= 1 << slot
+                    State.__soft_penalty[prof][slot] += SOFT_QUOTIENT
+                if interval in State.CONSTRAINTS[prof][INT_CONSTRAINTS]:
+                    State.__soft_interval_slots[prof] |= 1 << slot
+                    State.__soft_penalty[prof][slot] += SOFT_QUOTIENT
+
+        # flat candidate buffers of get_random_action
+        layout = State.LAYOUT
+        State.__day_order = list(range(len(layout.days)))
+        State.__interval_order = list(range(len(layout.intervals)))
+        State.__room_order = list(range(len(layout.rooms)))
+        State.__room_subjects, State.__room_subject_start = [], [0]
+        for classroom in layout.rooms:
+            State.__room_subjects.extend(layout.subject_idx[subject] for subject, _ in State.__room_index[classroom])
+            State.__room_subject_start.append(len(State.__room_subjects))
+        State.__prof_order, State.__prof_start = [], [0]
+        for subject in layout.subjects:
+            State.__prof_order.extend(layout.prof_idx[prof] for prof in State.SUBJECTS[subject][PROF_FOR_SUBJECT])
+            State.__prof_start.append(len(State.__prof_order))
+        State.__soft_day_bits = [State.__soft_day_slots[prof] for prof in layout.profs]
+        State.__soft_interval_bits = [State.__soft_interval_slots[prof] for prof in layout.profs]
+
+        # the intervals of a day are few, so the longest pause of every subset of them is precomputed
+        num_intervals = len(State.LAYOUT.intervals)
+        State.__max_pause_of_mask = [None] * (1 << num_intervals)
+        for mask in range(1 << num_intervals):
+            prof_classes = [interval for i, interval in enumerate(State.LAYOUT.intervals) if mask & (1 << i)]
+            if len(prof_classes) >= 2:
+                State.__max_pause_of_mask[mask] = State.__max_pause(prof_classes)
+
+        State.__batch = None
+        State.__renderer = None
+
+        # Zobrist keys -> own generator, so the search is not affected; the empty class has key 0 (empty timetable -> hash 0)
+        zobrist_rng = r.Random(0)
+        State.__num_codes = 1 + len(State.LAYOUT.profs) * len(State.LAYOUT.subjects)
+        State.__zobrist = [0 if code == 0 else zobrist_rng.getrandbits(64) for _ in range(State.LAYOUT.size) for code in range(State.__num_codes)]
 
         if debug_flag:
-            print("%" * 70 + " ENVIRONMENT " + "%" * 70)
-            print(f"\nClassrooms: {State.CLASSROOMS}")
-            print(f"\nSubjects: {State.SUBJECTS}")
-            print(f"\nProfessors: {State.PROF_SUBS}")
-            print(f"\nConstraints: {State.CONSTRAINTS}")
-            print("\n" + "%" * 152 + "\n")
+            State.__print_env()
+
+
+    @staticmethod
+    def __print_env():
+        '''
+            Prints the environment of the search space
+        '''
+        print("%" * 70 + " ENVIRONMENT " + "%" * 70)
+        print(f"\nClassrooms: {State.CLASSROOMS}")
+        print(f"\nSubjects: {State.SUBJECTS}")
+        print(f"\nProfessors: {State.PROF_SUBS}")
+        print(f"\nConstraints: {State.CONSTRAINTS}")
+        print("\n" + "%" * 152 + "\n")
+
+
+    @staticmethod
+    def __build_batch_index() -> dict:
+        '''
+            Builds the numpy arrays used by score_neighbourhood:
+                - one entry per candidate (slot, classroom, subject, professor) allowed by the compatibility index
+                - one entry per cell (slot, classroom) of the grid
+                - the static tables (soft penalties, pause limits, longest pauses, number of students)
+        '''
+        layout = State.LAYOUT
+        candidates = {'slot': [], 'cell': [], 'prof': [], 'subject': []}
+        for slot in range(layout.num_slots):
+            for room_idx, classroom in enumerate(layout.rooms):
+                for subject, profs in State.__room_index[classroom]:
+                    # the professor lists are shuffled by the search -> back to the order of the input file
+                    for prof in sorted(profs, key=layout.prof_idx.get):
+                        candidates['slot'].append(slot)
+                        candidates['cell'].append(slot * layout.num_rooms + room_idx)
+                        candidates['prof'].append(layout.prof_idx[prof])
+                        candidates['subject'].append(layout.subject_idx[subject])
+
+        batch = {key: np.array(value, dtype=np.int64) for key, value in candidates.items()}
+        batch['day'] = batch['slot'] // layout.num_intervals
+        batch['bit'] = 1 << (batch['slot'] % layout.num_intervals)
+
+        capacities = np.array([State.CLASSROOMS[classroom][CAPACITATE] for classroom in layout.rooms])
+        batch['cap'] = capacities[batch['cell'] % layout.num_rooms]
+
+        cells = np.arange(layout.size)
+        batch['cell_slot'] = cells // layout.num_rooms
+        batch['cell_day'] = batch['cell_slot'] // layout.num_intervals
+        batch['cell_bit'] = 1 << (batch['cell_slot'] % layout.num_intervals)
+        batch['cell_cap'] = capacities[cells % layout.num_rooms]
+
+        # no pause constraint -> a limit that is never exceeded, less than 2 classes -> a pause that never counts
+        no_limit = 1 << 30
+        batch['soft'] = np.array([State.__soft_penalty[prof] for prof in layout.profs], dtype=np.int64)
+        batch['pause'] = np.array([no_limit if State.CONSTRAINTS[prof][PAUSE] is None else State.CONSTRAINTS[prof][PAUSE] for prof in layout.profs])
+        batch['max_pause'] = np.array([-no_limit if p is None else p for p in State.__max_pause_of_mask])
+        batch['num_students'] = np.array([State.SUBJECTS[subject][NUM_STUDENTS] for subject in layout.subjects])
+        return batch
 
 
     @staticmethod
@@ -463,23 +1126,100 @@ class State:
         '''
             Generates the initial state (empty state)
         '''
-        empty_timetable = {day: {eval(interval): {classroom: None for classroom in State.__specs[SALI].keys()} for interval in State.__specs[INTERVALE]} for day in State.__specs[ZILE]}
         empty_profs = {prof: [] for prof in State.CONSTRAINTS.keys()}
+        if State.COMPACT:
+            return CompactTimetable(State.LAYOUT), empty_profs
+
+        empty_timetable = {day: {eval(interval): {classroom: None for classroom in State.__specs[SALI].keys()} for interval in State.__specs[INTERVALE]} for day in State.__specs[ZILE]}
         return empty_timetable, empty_profs
     
 
+    @staticmethod
+    def greedy_initial_state():
+        '''
+            Builds a near feasible initial state, instead of the empty one:
+            the subjects are placed most constrained first (fewest classrooms, like __sorted_subjects), each class in the
+            empty classroom / slot / professor that lowers the fitness the most (the random order of the candidates breaks the ties)
+            Respects the classrooms of the subjects, the professor collisions and the 7 classes cap -> a subject that can t be
+            placed anymore is left with students
+        '''
+        state = State()
+
+        for subject in State.__sorted_subjects:
+            profs = State.SUBJECTS[subject][PROF_FOR_SUBJECT]
+
+            while subject not in state.covered:
+                best_move, best_delta = None, None
+                for day, interval, classroom in random.sample(State.__cells, len(State.__cells)):
+                    if state.timetable[day][interval][classroom] is not None or subject not in State.CLASSROOMS[classroom][MATERII]:
+                        continue
+
+                    slot_bit = 1 << State.LAYOUT.slot_idx[(day, interval)]
+                    for prof in profs:
+                        if state.prof_busy[prof] & slot_bit or state.prof_load[prof] >= 7:
+                            continue
+
+                        delta = sum(state.move_delta(day, interval, classroom, prof, subject).values())
+                        if best_delta is None or delta < best_delta:
+                            best_move, best_delta = (day, interval, classroom, prof, subject), delta
+
+                if best_move is None:
+                    break
+                state.push_move(*best_move)
+
+        state.commit()
+        return state
+
+
     def clone(self):
         '''
             Returns a clone of the current state
+            The days and intervals of the timetable are shared (copy on write) -> the clone costs O(days), not O(timetable)
+        '''
+        new_state = State.__new__(State)
+        if self.__owned is None:
+            # a CompactTimetable is a single flat buffer -> copied at once
+            new_state.timetable = copy(self.timetable)
+            new_state.__owned = None
+        else:
+            new_state.timetable = dict(self.timetable)
+            new_state.__owned = set()
+            self.__owned.clear() # the days are now shared with the clone
+        new_state.slot_count = array('H', self.slot_count)
+        new_state.prof_busy = dict(self.prof_busy)
+        new_state.prof_load = dict(self.prof_load)
+        new_state.students = dict(self.students)
+        new_state.deficit = dict(self.deficit)
+        new_state.covered = set(self.covered)
+        new_state.fitness = dict(self.fitness)
+        new_state.zobrist = self.zobrist
+        new_state.depth = self.depth
+        new_state.__undo_log = []
+        return new_state
+
+
+    def timetable_dict(self) -> dict:
+        '''
+            Returns the timetable as a nested dict {day: {interval: {classroom: (professor, subject)}}}
+        '''
+        return timetable_to_dict(self.timetable)
+
+
+    @staticmethod
+    def renderer() -> TimetableRenderer:
+        '''
+            Returns the renderer of the timetables of the instance -> built from the environment, so the input file is not read again
         '''
-        return State(deepcopy(self.timetable), deepcopy(self.profs), deepcopy(self.students), deepcopy(self.fitness), depth=self.depth)
+        if State.__renderer is None:
+            State.__renderer = TimetableRenderer(State.PROF_SUBS.keys(), State.LAYOUT.rooms)
+        return State.__renderer
 
 
     def __str__(self):
         '''
             Returns a string representation of the state
         '''
-        timetable_str = f"\n\n{pretty_print_timetable(self.timetable, State.INPUT_FILE)}"
+        timetable_str = f"\n\n{State.renderer().render(self.timetable_dict())}"
         fitness_str = ''
         # fitness_str = f"{'#' * 50} FITNESS: {self.fitness} {'#' * 50}\n\n"
 
@@ -1,4 +1,3 @@
-import yaml
 import argparse
 import sys
 
@@ -13,6 +12,8 @@ def read_yaml_file(file_path : str) -> dict:
     '''
     Citeste un fișier yaml și returnează conținutul său sub formă de dicționar
     '''
+    import yaml # importat doar la nevoie -> instantele compilate (State.CACHE_DIR) nu il folosesc
+
     with open(file_path, 'r') as file:
         return yaml.safe_load(file)
 
@@ -89,53 +90,99 @@ def allign_string_with_spaces(s : str, max_len : int, allignment_type : str = 'c
     return s
 
 
-def pretty_print_timetable_aux_zile(timetable : {str : {(int, int) : {str : (str, str)}}}, input_path : str) -> str:
+class TimetableRenderer:
     '''
-    Primește un dicționar ce are chei zilele, cu valori dicționare de intervale reprezentate ca tupluri de int-uri, cu valori dicționare de săli, cu valori tupluri (profesor, materie)
+    Afișează orarele unei instanțe sub formă de tabel (vezi pretty_print_timetable_aux_zile)
 
-    Returnează un string formatat să arate asemenea unui tabel excel cu zilele pe linii, intervalele pe coloane și în intersecția acestora, ferestrele de 2 ore cu materiile alocate în fiecare sală fiecărui profesor
+    Inițialele profesorilor, ordinea sălilor și textul fiecărei celule (sală, profesor, materie) sunt calculate o singură dată
+    pentru instanță, iar tabelul este construit ca o listă de bucăți unite la final (sau scrise direct într-un fișier)
     '''
+    HEADER = '|           Interval           |             Luni             |             Marti            |           Miercuri           |              Joi             |            Vineri            |\n'
+    DELIM = '-' * 187 + '\n'
+    MAX_LEN = 30
+
+    def __init__(self, profs : list, rooms : list = None):
+        self.profs_to_initials, _ = get_profs_initials(profs)
+        self.rooms = list(rooms) if rooms is not None else None # None -> ordinea sălilor din primul orar afișat
+        self.__cells = {} # (sală, (profesor, materie) sau None) -> textul celulei
+        self.__intervals = {} # interval -> textul primei coloane
+
+    def __cell(self, classroom : str, value : tuple) -> str:
+        '''
+        Returnează textul (aliniat) al unei celule din tabel
+        '''
+        key = (classroom, value)
+        cell = self.__cells.get(key)
+        if cell is None:
+            if not value:
+                cell = allign_string_with_spaces(f'{classroom} - goala', self.MAX_LEN, 'left')
+            else:
+                prof, subject = value
+                cell = allign_string_with_spaces(f'{subject} : ({classroom} - {self.profs_to_initials[prof]})', self.MAX_LEN, 'left')
+            self.__cells[key] = cell
+        return cell
+
+    def iter_lines(self, timetable : {str : {(int, int) : {str : (str, str)}}}):
+        '''
+        Generează pe rând bucățile tabelului unui orar cu zilele drept chei
+        '''
+        days = list(timetable)
+        first_day = timetable['Luni']
+        if self.rooms is None:
+            self.rooms = list(first_day[next(iter(first_day))].keys())
+        cell = self.__cell
+        empty_interval = f'|{self.MAX_LEN * " "}'
+
+        yield self.HEADER
+        yield self.DELIM
+
+        for interval in first_day:
+            s_interval = self.__intervals.get(interval)
+            if s_interval is None:
+                s_interval = self.__intervals[interval] = '|' + allign_string_with_spaces(f'{interval[0]} - {interval[1]}', self.MAX_LEN, 'center')
+
+            classes = [timetable[day][interval] for day in days]
+            for class_idx, classroom in enumerate(self.rooms):
+                yield s_interval if class_idx == 0 else empty_interval
+                for day_classes in classes:
+                    yield '|'
+                    yield cell(classroom, day_classes[classroom])
+                yield '|\n'
+            yield self.DELIM
+
+    def render(self, timetable : {str : {(int, int) : {str : (str, str)}}}) -> str:
+        '''
+        Returnează tabelul unui orar cu zilele drept chei
+        '''
+        return ''.join(self.iter_lines(timetable))
+
+    def write(self, timetable : {str : {(int, int) : {str : (str, str)}}}, file):
+        '''
+        Scrie tabelul unui orar cu zilele drept chei în fișierul dat, fără a construi tot string-ul
+        '''
+        file.writelines(self.iter_lines(timetable))
+
+
+_renderers = {} # fișier de intrare -> TimetableRenderer
+
+
+def get_timetable_renderer(input_path : str) -> TimetableRenderer:
+    '''
+    Returnează afișorul orarelor fișierului de intrare dat -> fișierul yaml este citit doar la primul apel
+    '''
+    renderer = _renderers.get(input_path)
+    if renderer is None:
+        renderer = _renderers[input_path] = TimetableRenderer(read_yaml_file(input_path)[PROFESORI].keys())
+    return renderer
 
-    max_len = 30
-
-    profs = read_yaml_file(input_path)[PROFESORI].keys()
-    profs_to_initials, _ = get_profs_initials(profs)
-
-    table_str = '|           Interval           |             Luni             |             Marti            |           Miercuri           |              Joi             |            Vineri            |\n'
-
-    no_classes = len(timetable['Luni'][(8, 10)])
-
-    first_line_len = 187
-    delim = '-' * first_line_len + '\n'
-    table_str = table_str + delim
-    
-    for interval in timetable['Luni']:
-        s_interval = '|'
-        
-        crt_str = allign_string_with_spaces(f'{interval[0]} - {interval[1]}', max_len, 'center')
-
-        s_interval += crt_str
-
-        for class_idx in range(no_classes):
-            if class_idx != 0:
-                s_interval += f'|{30 * " "}'
-
-            for day in timetable:
-                classes = timetable[day][interval]
-                classroom = list(classes.keys())[class_idx]
-
-                s_interval += '|'
 
-                if not classes[classroom]:
-                    s_interval += allign_string_with_spaces(f'{classroom} - goala', max_len, 'left')
-                else:
-                    prof, subject = classes[classroom]
-                    s_interval += allign_string_with_spaces(f'{subject} : ({classroom} - {profs_to_initials[prof]})', max_len, 'left')
-            
-            s_interval += '|\n'
-        table_str += s_interval + delim
+def pretty_print_timetable_aux_zile(timetable : {str : {(int, int) : {str : (str, str)}}}, input_path : str) -> str:
+    '''
+    Primește un dicționar ce are chei zilele, cu valori dicționare de intervale reprezentate ca tupluri de int-uri, cu valori dicționare de săli, cu valori tupluri (profesor, materie)
 
-    return table_str
+    Returnează un string formatat să arate asemenea unui tabel excel cu zilele pe linii, intervalele pe coloane și în intersecția acestora, ferestrele de 2 ore cu materiile alocate în fiecare sală fiecărui profesor
+    '''
+    return get_timetable_renderer(input_path).render(timetable)
 
 def pretty_print_timetable_aux_intervale(timetable : {(int, int) : {str : {str : (str, str)}}}, input_path : str) -> str:
     '''
@@ -146,8 +193,7 @@ def pretty_print_timetable_aux_intervale(timetable : {(int, int) : {str : {str :
 
     max_len = 30
 
-    profs = read_yaml_file(input_path)[PROFESORI].keys()
-    profs_to_initials, _ = get_profs_initials(profs)
+    profs_to_initials = get_timetable_renderer(input_path).profs_to_initials
 
     table_str = '|           Interval           |             Luni             |             Marti            |           Miercuri           |              Joi             |            Vineri            |\n'
 